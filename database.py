@@ -1,11 +1,22 @@
 import os
 from dotenv import load_dotenv
 from sqlmodel import SQLModel, Session, create_engine
-from sqlalchemy.exc import OperationalError
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.pool import NullPool  # Prevents closing connections on each commit
 
-import time
 import logging
+from typing import Awaitable, Callable, TypeVar
+
+from lib.metrics import counter
+from lib.retry import classify_error, retry_async
+from lib.tracing import span
+
+T = TypeVar("T")
+
+commit_failures = counter("db_commit_failures_total", "Failed commits, by operation and retryable reason")
 
 # ✅ Load environment variables
 load_dotenv()
@@ -24,47 +35,89 @@ engine = create_engine(DATABASE_URL, echo=False,
     pool_pre_ping=True,   # ✅ Check if the connection is still alive before using)  # ✅ echo=True for debugging
     # poolclass=NullPool
 )
+# ✅ Async engine (asyncpg) used by the API handlers and background jobs
+def _async_engine_url(url: str):
+    """Derives the asyncpg URL from DATABASE_URL. asyncpg takes `ssl` instead of libpq's `sslmode`."""
+    async_url = make_url(url).set(drivername="postgresql+asyncpg")
+    connect_args = {}
+    sslmode = async_url.query.get("sslmode")
+    async_url = async_url.difference_update_query(["sslmode", "channel_binding"])
+    if sslmode and sslmode != "disable":
+        connect_args["ssl"] = sslmode
+    return async_url, connect_args
+
+ASYNC_DATABASE_URL, ASYNC_CONNECT_ARGS = _async_engine_url(os.getenv("ASYNC_DATABASE_URL") or DATABASE_URL)
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=False,
+    pool_size=10,
+    max_overflow=20,
+    pool_recycle=300,
+    pool_pre_ping=True,
+    connect_args=ASYNC_CONNECT_ARGS,
+)
+
+# ✅ Idempotent schema changes for existing tables (create_all only creates tables that are missing)
+MIGRATIONS = [
+    "ALTER TABLE comic ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE comic ADD COLUMN IF NOT EXISTS page_storage VARCHAR NOT NULL DEFAULT 'jsonb'",
+    "ALTER TABLE comic ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now()",
+    "ALTER TABLE comic ADD COLUMN IF NOT EXISTS characters JSONB",
+    "ALTER TABLE comic ADD COLUMN IF NOT EXISTS story_summary TEXT",
+    "ALTER TABLE comic ADD COLUMN IF NOT EXISTS summarized_pages INTEGER NOT NULL DEFAULT 0",
+    "CREATE INDEX IF NOT EXISTS ix_comic_user_created ON comic (user_id, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_comic_visibility_created ON comic (visibility, created_at, id)",
+    "ALTER TABLE generation_job ADD COLUMN IF NOT EXISTS started_at TIMESTAMPTZ",
+    "CREATE INDEX IF NOT EXISTS ix_generation_job_updated ON generation_job (updated_at)",
+]
+
 # ✅ Function to Initialize DB
 def init_db():
     SQLModel.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for statement in MIGRATIONS:
+            conn.execute(text(statement))
 
 # ✅ Dependency to Get a Database Session
 def get_session():
     with Session(engine) as session:
         yield session
 
-# ✅ Commit with Automatic Retry (Handles Intermittent Errors)
-# def commit_with_retry(session, retries=3):
-#     """Commit transaction with retries to handle transient failures."""
-#     for attempt in range(retries):
-#         try:
-#             session.commit()
-#             return
-#         except OperationalError as e:
-#             session.rollback()
-#             print(f"❌ Commit failed (attempt {attempt + 1}): {e}")
-#             if attempt == retries - 1:
-#                 raise
-#             time.sleep(1)  # ✅ Small delay before retrying
-
-# ✅ Commit with Automatic Retry (Handles Intermittent Errors)
-def commit_with_retry(session, retries=5, base_delay=1, max_delay=30):
-    """Commit transaction with retries and exponential backoff."""
-    for attempt in range(retries):
-        try:
-            session.commit()
-            logging.info("✅ Commit successful.")
-            return
-        except OperationalError as e:
-            session.rollback()
-            logging.error(f"❌ Commit failed (attempt {attempt + 1}/{retries}): {e}")
-            if attempt == retries - 1:
-                logging.error("❌ Maximum retries reached. Commit failed.")
-                raise
-            delay = min(base_delay * (2 ** attempt), max_delay)
-            logging.info(f"Retrying in {delay} seconds...")
-            time.sleep(delay)
-        except Exception as e:
-            session.rollback()
+# ✅ Async session factory. expire_on_commit=False because async sessions can't lazy-load expired attributes;
+# re-read rows with `populate_existing=True` after raw UPDATE statements.
+def async_session() -> AsyncSession:
+    return AsyncSession(async_engine, expire_on_commit=False)
+
+async def get_async_session():
+    async with async_session() as session:
+        yield session
+
+# ✅ Async commit. A failed COMMIT has already lost the transaction (rolling back discards the pending writes),
+# so committing again would silently succeed with nothing in it. Instead the error is classified, recorded and
+# re-raised; retry the whole unit of work with `run_transaction`, or let the job queue re-run the job.
+async def async_commit(session: AsyncSession, operation: str = "commit"):
+    """Commits the session once, never retrying; on failure rolls back and re-raises."""
+    try:
+        with span("db_commit", operation=operation):
+            await session.commit()
+        logging.info("✅ Commit successful.")
+    except Exception as e:
+        await session.rollback()
+        reason = classify_error(e)
+        commit_failures.inc(operation=operation, reason=reason or "fatal")
+        if reason:
+            logging.error(f"❌ Commit failed ({reason}), the caller's unit of work must be retried: {e}")
+        else:
             logging.error(f"An unexpected error occured during commit: {e}")
-            raise #re-raise the error.
\ No newline at end of file
+        raise
+
+# ✅ Retryable unit of work: runs `work(session)` and commits in a fresh session per attempt
+async def run_transaction(work: Callable[[AsyncSession], Awaitable[T]], operation: str = "transaction",
+                          **retry_options) -> T:
+    """Runs a whole transaction with classified retries, jittered backoff and a total deadline (see lib/retry.py)."""
+    async def attempt():
+        with span("db_transaction", operation=operation):
+            async with async_session() as session:
+                result = await work(session)
+                await session.commit()
+                return result
+    return await retry_async(attempt, operation, **retry_options)
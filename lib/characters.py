@@ -0,0 +1,79 @@
+"""Per-comic character registry.
+
+The characters from a comic's ComicScript are stored on `comic.characters` when the
+comic is created, so extending it no longer re-derives them from every page's
+image_prompt. New characters introduced by an extension are appended; existing
+ones are never rewritten, which is what keeps them looking the same.
+
+`character_matcher(characters)` compiles one combined pattern per character set
+(cached), and `expand_image_prompt` uses it to replace every `Character: <Name>`
+mention, with or without the description already attached, by the stored
+`Character: <Name>, <description>` in a single pass.
+"""
+import re
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
+
+# Legacy extraction from image prompts ("Character: <name>, <description> | ..."), for comics created before the registry
+IMAGE_PROMPT_CHARACTER = re.compile(r"Character:\s*([^,]+),\s*(.*?)(?=\s*\|\s*|$)")
+
+CharacterKey = Tuple[Tuple[str, str], ...]
+
+
+def normalize_characters(characters: Optional[Iterable[dict]]) -> List[dict]:
+    """Characters with a name and description, first occurrence of each name wins."""
+    registry = {}
+    for char in characters or []:
+        name = (char.get("name") or "").strip()
+        if name and name not in registry:
+            registry[name] = {"name": name, "description": (char.get("description") or "").strip(),
+                              **({"personality": char["personality"]} if char.get("personality") else {})}
+    return list(registry.values())
+
+
+def merge_characters(existing: Optional[List[dict]], new: Optional[Iterable[dict]]) -> List[dict]:
+    """Appends characters not already in `existing`; known characters keep their stored description."""
+    return normalize_characters(list(existing or []) + list(new or []))
+
+
+def characters_from_pages(pages: Iterable[dict]) -> List[dict]:
+    """Characters mentioned in image prompts; the last description seen for a name wins (legacy behaviour)."""
+    registry = {}
+    for page in pages:
+        for name, description in IMAGE_PROMPT_CHARACTER.findall(page.get("image_prompt", "")):
+            registry[name.strip()] = {"name": name.strip(), "description": description.strip()}
+    return list(registry.values())
+
+
+class CharacterMatcher:
+    """One compiled alternation over every character; each alternative has one capturing group."""
+
+    def __init__(self, key: CharacterKey):
+        self.replacements = [f"Character: {name}, {description}" for name, description in key]
+        # Longest names first so "Bap Jr" isn't matched as "Bap"; an already attached description is consumed
+        order = sorted(range(len(key)), key=lambda i: -len(key[i][0]))
+        self.group_to_index = {group: i for group, i in enumerate(order, start=1)}
+        alternatives = [f"({re.escape(key[i][0])})(?!\\w)(?:,\\s*{re.escape(key[i][1])})?" for i in order]
+        self.pattern = re.compile(r"Character:\s*(?:" + "|".join(alternatives) + ")") if key else None
+
+    def _replace(self, match: "re.Match") -> str:
+        return self.replacements[self.group_to_index[match.lastindex]]
+
+    def expand(self, image_prompt: str) -> str:
+        if self.pattern is None:
+            return image_prompt
+        return self.pattern.sub(self._replace, image_prompt)
+
+
+@lru_cache(maxsize=256)
+def _matcher(key: CharacterKey) -> CharacterMatcher:
+    return CharacterMatcher(key)
+
+
+def character_matcher(characters: Iterable[dict]) -> CharacterMatcher:
+    return _matcher(tuple((char["name"], char["description"]) for char in characters))
+
+
+def expand_image_prompt(image_prompt: str, characters: Iterable[dict]) -> str:
+    """Replaces character names in an image_prompt with their full stored descriptions."""
+    return character_matcher(characters).expand(image_prompt)
@@ -0,0 +1,155 @@
+"""Provider client registry.
+
+Every SDK client is built once per process on first use and then shared:
+
+    from lib.clients import genai_client, openai_client, async_openai_client
+    genai_client().models.generate_content(...)          # sync
+    await genai_client().aio.models.generate_content(...) # async
+
+Google clients (genai, Cloud Storage) share one set of service-account credentials
+parsed in memory from GOOGLE_APPLICATION_CREDENTIALS_JSON; the OpenAI-compatible
+clients (OpenAI, DeepSeek, Groq) share one httpx connection pool per flavour
+(sync/async), so TLS and auth setup happen once instead of on every request.
+"""
+import os
+import json
+import threading
+from functools import wraps
+from typing import Callable, Optional, TypeVar
+
+import httpx
+import instructor
+from google import genai
+from google.cloud import storage
+from google.oauth2 import service_account
+from groq import AsyncGroq, Groq
+from openai import AsyncOpenAI, OpenAI
+from together import AsyncTogether, Together
+
+T = TypeVar("T")
+
+GOOGLE_SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
+DEEPSEEK_BASE_URL = "https://api.deepseek.com"
+HTTP_TIMEOUT_SECONDS = float(os.getenv("PROVIDER_HTTP_TIMEOUT_SECONDS", "120"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("PROVIDER_HTTP_MAX_CONNECTIONS", "50"))
+
+_lock = threading.RLock()
+
+
+def _once(factory: Callable[..., T]) -> Callable[..., T]:
+    """Caches the factory's result per argument tuple; concurrent first calls build a single instance."""
+    instances = {}
+
+    @wraps(factory)
+    def get(*args):
+        if args not in instances:
+            with _lock:
+                if args not in instances:
+                    instances[args] = factory(*args)
+        return instances[args]
+
+    get.cache_clear = instances.clear
+    return get
+
+
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS // 2)
+
+
+# --- Shared building blocks -------------------------------------------------
+
+@_once
+def google_credentials() -> Optional[service_account.Credentials]:
+    """Service-account credentials from GOOGLE_APPLICATION_CREDENTIALS_JSON, or None to use the default chain."""
+    credentials_json_str = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS_JSON")
+    if not credentials_json_str:
+        return None
+    try:
+        info = json.loads(credentials_json_str)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON format in GOOGLE_APPLICATION_CREDENTIALS_JSON: {e}")
+    if "private_key" not in info:
+        raise ValueError("Missing 'private_key' in GOOGLE_APPLICATION_CREDENTIALS_JSON.")
+    return service_account.Credentials.from_service_account_info(info, scopes=GOOGLE_SCOPES)
+
+
+def google_project() -> Optional[str]:
+    credentials = google_credentials()
+    return os.environ.get("PROJECT_ID") or (credentials.project_id if credentials else None)
+
+
+def google_location() -> str:
+    return os.environ.get("LOCATION", "us-central1")
+
+
+@_once
+def http_client() -> httpx.Client:
+    return httpx.Client(timeout=HTTP_TIMEOUT_SECONDS, limits=_http_limits())
+
+
+@_once
+def async_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(timeout=HTTP_TIMEOUT_SECONDS, limits=_http_limits())
+
+
+# --- Provider clients -------------------------------------------------------
+
+@_once
+def genai_client(project: Optional[str] = None, location: Optional[str] = None) -> genai.Client:
+    """Vertex AI Gemini/Imagen client; use `.models` for sync calls and `.aio.models` for async ones."""
+    return genai.Client(
+        vertexai=True,
+        project=project or google_project(),
+        location=location or google_location(),
+        credentials=google_credentials(),
+    )
+
+
+@_once
+def storage_client() -> storage.Client:
+    credentials = google_credentials()
+    if credentials is None:
+        return storage.Client()
+    return storage.Client(project=google_project(), credentials=credentials)
+
+
+@_once
+def openai_client() -> OpenAI:
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client())
+
+
+@_once
+def async_openai_client() -> AsyncOpenAI:
+    return AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=async_http_client())
+
+
+@_once
+def deepseek_client() -> OpenAI:
+    return OpenAI(api_key=os.getenv("DEEPSEEK_API_KEY"), base_url=DEEPSEEK_BASE_URL, http_client=http_client())
+
+
+@_once
+def async_deepseek_client() -> AsyncOpenAI:
+    return AsyncOpenAI(api_key=os.getenv("DEEPSEEK_API_KEY"), base_url=DEEPSEEK_BASE_URL,
+                       http_client=async_http_client())
+
+
+@_once
+def groq_client():
+    """Groq wrapped by instructor for `response_model=` structured output."""
+    return instructor.from_groq(Groq(http_client=http_client()), mode=instructor.Mode.JSON)
+
+
+@_once
+def async_groq_client():
+    return instructor.from_groq(AsyncGroq(http_client=async_http_client()), mode=instructor.Mode.JSON)
+
+
+@_once
+def together_client() -> Together:
+    return Together(api_key=os.getenv("TOGETHER_API_KEY"))
+
+
+@_once
+def async_together_client() -> AsyncTogether:
+    return AsyncTogether(api_key=os.getenv("TOGETHER_API_KEY"))
@@ -0,0 +1,235 @@
+"""Local stand-ins for Gemini, Imagen and Cloud Storage, used by loadtest.py.
+
+`install(config)` swaps the shared genai and storage clients for fakes with
+configurable latency distributions and error rates, so the app runs its real
+request, queue, rate-limiter, upload-pool and database code without spending quota.
+Every fake call is timed; `stats()` returns the samples per stage.
+
+Latency specs (seconds, scaled by FAKE_TIME_SCALE / `LatencyDist.scale`):
+
+    fixed:0.5             always 0.5
+    uniform:1:3           uniformly between 1 and 3
+    lognormal:8:20        median 8, p95 20 (long right tail, like real model calls)
+"""
+import os
+import json
+import math
+import time
+import uuid
+import random
+import asyncio
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Dict, List
+
+Z95 = 1.6449  # Standard normal quantile for p95
+
+
+class FakeProviderError(Exception):
+    """Raised by a stand-in to simulate a provider failure; 'RESOURCE_EXHAUSTED' ones look like rate limits."""
+
+
+class LatencyDist:
+    def __init__(self, spec: str, scale: float = 1.0):
+        self.spec = spec
+        self.scale = scale
+        kind, *params = spec.split(":")
+        self.kind = kind
+        self.params = [float(p) for p in params]
+        if kind == "lognormal":
+            median, p95 = self.params
+            self.mu = math.log(median)
+            self.sigma = max(0.0, math.log(p95 / median) / Z95)
+        elif kind not in ("fixed", "uniform"):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self) -> float:
+        if self.kind == "fixed":
+            value = self.params[0]
+        elif self.kind == "uniform":
+            value = random.uniform(*self.params)
+        else:
+            value = random.lognormvariate(self.mu, self.sigma)
+        return value * self.scale
+
+
+class StandIn:
+    """Latency, error rate and timing samples for one fake dependency."""
+
+    def __init__(self, name: str, latency: str, error_rate: float = 0.0, scale: float = 1.0):
+        self.name = name
+        self.latency = LatencyDist(latency, scale)
+        self.error_rate = error_rate
+
+    def fail(self) -> bool:
+        return random.random() < self.error_rate
+
+    def error(self) -> FakeProviderError:
+        return FakeProviderError(f"{self.name}: 429 RESOURCE_EXHAUSTED (simulated)" if random.random() < 0.5
+                                 else f"{self.name}: 503 UNAVAILABLE (simulated)")
+
+
+class Samples:
+    def __init__(self):
+        self.values: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float, ok: bool = True):
+        with self._lock:
+            if ok:
+                self.values[stage].append(seconds)
+            else:
+                self.errors[stage] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"values": {k: list(v) for k, v in self.values.items()}, "errors": dict(self.errors)}
+
+
+samples = Samples()
+
+
+def fake_script(pages: int, tag: str) -> dict:
+    """A ComicScript with unique page content, so script and image caches don't hide the work."""
+    return {
+        "title": f"Load test {tag}",
+        "summary": f"Synthetic story {tag}",
+        "characters": [{"name": "Bap", "description": "a small green dragon with big blue eyes", "personality": "cheerful"}],
+        "pages": [{
+            "scene": f"Scene {i + 1} of {tag}",
+            "text_full": f"Bap explores part {i + 1} of the {tag} adventure.",
+            "dialogue": [{"character": "Bap", "text": f"Line {i + 1}"}],
+            "image_prompt": f"cartoon style | Scene: {tag} page {i + 1} | Character: Bap, a small green dragon with big blue eyes",
+            "art_style": "cartoon",
+            "final_transition": f"On to part {i + 2}",
+        } for i in range(pages)],
+    }
+
+
+def _usage(contents) -> SimpleNamespace:
+    tokens = len(str(contents)) // 4
+    return SimpleNamespace(prompt_token_count=tokens, cached_content_token_count=0, candidates_token_count=500)
+
+
+class FakeGenai:
+    """Enough of google.genai.Client for text generation, streaming, token counting, caches and Imagen."""
+
+    def __init__(self, text: StandIn, image: StandIn, pages: int):
+        self.text = text
+        self.image = image
+        self.pages = pages
+        self.models = SimpleNamespace(generate_content=self._generate, count_tokens=self._count_tokens,
+                                      generate_images=self._generate_images)
+        self.aio = SimpleNamespace(models=SimpleNamespace(generate_content=self._generate_async,
+                                                          generate_content_stream=self._generate_stream))
+        self.caches = SimpleNamespace(create=self._create_cache)
+
+    def _response_text(self, contents) -> str:
+        if str(contents).startswith("Word limit"):
+            return "Bap has had a long synthetic adventure so far."
+        return json.dumps(fake_script(self.pages, uuid.uuid4().hex[:8]))
+
+    def _generate(self, model=None, contents=None, config=None):
+        start = time.perf_counter()
+        time.sleep(self.text.latency.sample())
+        if self.text.fail():
+            samples.record("fake_text", time.perf_counter() - start, ok=False)
+            raise self.text.error()
+        samples.record("fake_text", time.perf_counter() - start)
+        return SimpleNamespace(text=self._response_text(contents), usage_metadata=_usage(contents))
+
+    async def _generate_async(self, model=None, contents=None, config=None):
+        start = time.perf_counter()
+        await asyncio.sleep(self.text.latency.sample())
+        if self.text.fail():
+            samples.record("fake_text", time.perf_counter() - start, ok=False)
+            raise self.text.error()
+        samples.record("fake_text", time.perf_counter() - start)
+        return SimpleNamespace(text=self._response_text(contents), usage_metadata=_usage(contents))
+
+    async def _generate_stream(self, model=None, contents=None, config=None):
+        total = self.text.latency.sample()
+        if self.text.fail():
+            await asyncio.sleep(total * 0.2)
+            samples.record("fake_text_stream", total * 0.2, ok=False)
+            raise self.text.error()
+        body = self._response_text(contents)
+        chunk_size = max(1, len(body) // (self.pages * 4))
+
+        async def chunks():
+            start = time.perf_counter()
+            await asyncio.sleep(total * 0.2)  # Time to first token
+            samples.record("fake_text_first_chunk", time.perf_counter() - start)
+            parts = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+            for i, part in enumerate(parts):
+                last = i == len(parts) - 1
+                yield SimpleNamespace(text=part, usage_metadata=_usage(contents) if last else None)
+                await asyncio.sleep(total * 0.8 / len(parts))
+            samples.record("fake_text_stream", time.perf_counter() - start)
+
+        return chunks()
+
+    def _count_tokens(self, model=None, contents=None, config=None):
+        return SimpleNamespace(total_tokens=len(str(contents)) // 4)
+
+    def _create_cache(self, model=None, config=None):
+        return SimpleNamespace(name=f"cachedContents/fake-{uuid.uuid4().hex[:8]}",
+                               expire_time=datetime.now(timezone.utc) + timedelta(hours=1))
+
+    def _generate_images(self, model=None, prompt=None, config=None):
+        start = time.perf_counter()
+        time.sleep(self.image.latency.sample())
+        if self.image.fail():
+            samples.record("fake_image", time.perf_counter() - start, ok=False)
+            raise self.image.error()
+        samples.record("fake_image", time.perf_counter() - start)
+        image = SimpleNamespace(image_bytes=os.urandom(2048))
+        return SimpleNamespace(generated_images=[SimpleNamespace(image=image)])
+
+
+class FakeBlob:
+    def __init__(self, storage: "FakeStorage", bucket: str, name: str):
+        self.storage = storage
+        self.public_url = f"{storage.base_url}/{bucket}/{name}"
+
+    def upload_from_string(self, data, content_type=None):
+        start = time.perf_counter()
+        time.sleep(self.storage.upload.latency.sample())
+        if self.storage.upload.fail():
+            samples.record("fake_gcs_upload", time.perf_counter() - start, ok=False)
+            raise self.storage.upload.error()
+        samples.record("fake_gcs_upload", time.perf_counter() - start)
+
+
+class FakeStorage:
+    """Enough of google.cloud.storage.Client for GCSUploader."""
+
+    def __init__(self, upload: StandIn, base_url: str = "http://fake-gcs.local"):
+        self.upload = upload
+        self.base_url = base_url
+
+    def bucket(self, name: str):
+        return SimpleNamespace(exists=lambda: True, blob=lambda blob_name: FakeBlob(self, name, blob_name))
+
+
+def install(text_latency: str, image_latency: str, upload_latency: str, text_errors: float = 0.0,
+            image_errors: float = 0.0, upload_errors: float = 0.0, pages: int = 4, scale: float = 1.0):
+    """Points the app's Gemini, Imagen and GCS clients at the stand-ins. Call before the app starts serving."""
+    from lib import gcs_uploader, gen_image, gen_text, prompts, text_router
+    from lib.gen_text import gemini_text_generation_async
+
+    genai = FakeGenai(StandIn("gemini", text_latency, text_errors, scale),
+                      StandIn("imagen", image_latency, image_errors, scale), pages)
+    storage = FakeStorage(StandIn("gcs", upload_latency, upload_errors, scale))
+    for module in (gen_text, gen_image, prompts):
+        module.genai_client = lambda *args, **kwargs: genai
+    gcs_uploader.storage_client = lambda: storage
+
+    # Only Gemini is faked; route every script there regardless of which API keys are set
+    router = text_router.text_router
+    router.providers = {"gemini": gemini_text_generation_async}
+    router.stats = {"gemini": text_router.ProviderStats()}
+    return genai, storage
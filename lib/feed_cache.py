@@ -0,0 +1,74 @@
+import os
+import time
+import hashlib
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+FEED_CACHE_TTL_SECONDS = float(os.getenv("FEED_CACHE_TTL_SECONDS", "30"))  # Longest a page is served without a rebuild
+FEED_CACHE_MAX_ENTRIES = int(os.getenv("FEED_CACHE_MAX_ENTRIES", "256"))
+
+
+def strong_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def _opaque_tag(etag: str) -> str:
+    etag = etag.strip()
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """True when an If-None-Match header lists `etag` (or is `*`).
+
+    Uses the weak comparison RFC 9110 specifies for If-None-Match, so a `W/"..."` validator
+    sent back by a proxy or browser matches the same tag.
+    """
+    if not if_none_match:
+        return False
+    candidates = [_opaque_tag(value) for value in if_none_match.split(",")]
+    return "*" in candidates or _opaque_tag(etag) in candidates
+
+
+class FeedCache:
+    """Rendered feed pages (JSON body, ETag, next cursor) keyed by request parameters.
+
+    Entries are dropped by `invalidate()` when a feed event arrives, and expire after
+    `ttl` seconds in case an event was missed.
+    """
+
+    def __init__(self, ttl: float = FEED_CACHE_TTL_SECONDS, max_entries: int = FEED_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.generation = 0  # Bumped by invalidate(); pages built before an invalidation are not stored
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[float, bytes, str, Optional[str]]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Tuple[bytes, str, Optional[str]]]:
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[1:]
+
+    def put(self, key: Hashable, body: bytes, next_cursor: Optional[str], generation: int) -> str:
+        """Stores a rendered page unless the feed changed while it was being built. Returns its ETag."""
+        etag = strong_etag(body)
+        if self.ttl > 0 and generation == self.generation:
+            self._entries[key] = (time.monotonic(), body, etag, next_cursor)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return etag
+
+    def invalidate(self):
+        self.generation += 1
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "ttl": self.ttl, "hits": self.hits, "misses": self.misses}
+
+
+community_feed_cache = FeedCache()
@@ -0,0 +1,106 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import concurrent.futures
+from typing import Dict, Tuple
+
+from google.cloud import storage
+
+from lib.clients import storage_client
+from lib.metrics import counter, histogram
+from lib.tracing import span
+
+logger = logging.getLogger(__name__)
+
+GCS_UPLOAD_WORKERS = int(os.getenv("GCS_UPLOAD_WORKERS", "8"))
+GCS_BUCKET_REVALIDATE_SECONDS = int(os.getenv("GCS_BUCKET_REVALIDATE_SECONDS", "600"))
+GCS_UPLOAD_RETRIES = int(os.getenv("GCS_UPLOAD_RETRIES", "3"))
+
+upload_seconds = histogram("gcs_upload_seconds", "Latency of a single GCS object upload")
+upload_bytes = counter("gcs_upload_bytes_total", "Bytes uploaded to GCS")
+upload_failures = counter("gcs_upload_failures_total", "GCS upload attempts that raised")
+
+
+class BucketNotFound(Exception):
+    pass
+
+
+class GCSUploader:
+    """Long-lived uploader: one storage client, cached bucket handles and a bounded upload pool."""
+
+    def __init__(self, max_workers: int = GCS_UPLOAD_WORKERS,
+                 revalidate_seconds: int = GCS_BUCKET_REVALIDATE_SECONDS,
+                 max_retries: int = GCS_UPLOAD_RETRIES):
+        self.revalidate_seconds = revalidate_seconds
+        self.max_retries = max_retries
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers,
+                                                               thread_name_prefix="gcs-upload")
+        self._buckets: Dict[str, Tuple[storage.Bucket, float]] = {}
+
+        # Rolling totals for stats()
+        self.uploads = 0
+        self.bytes_uploaded = 0
+        self.upload_time = 0.0
+
+    def _get_bucket(self, bucket_name: str) -> storage.Bucket:
+        """Returns a cached bucket handle, checking it still exists at most every `revalidate_seconds`."""
+        cached = self._buckets.get(bucket_name)
+        if cached and time.monotonic() - cached[1] < self.revalidate_seconds:
+            return cached[0]
+
+        bucket = cached[0] if cached else storage_client().bucket(bucket_name)
+        if not bucket.exists():
+            self._buckets.pop(bucket_name, None)
+            raise BucketNotFound(f"Bucket {bucket_name} does not exist.")
+        self._buckets[bucket_name] = (bucket, time.monotonic())
+        return bucket
+
+    def _upload_blocking(self, data: bytes, bucket_name: str, blob_name: str, content_type: str) -> str:
+        blob = self._get_bucket(bucket_name).blob(blob_name)
+        blob.upload_from_string(data, content_type=content_type)
+        return blob.public_url
+
+    async def upload(self, data: bytes, bucket_name: str, blob_name: str, content_type: str = "image/png") -> str:
+        """Uploads bytes on the upload pool with retry and backoff, returning the public URL."""
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries):
+            start = time.perf_counter()
+            try:
+                with span("gcs_upload", bucket=bucket_name, blob=blob_name, bytes=len(data), attempt=attempt + 1):
+                    url = await loop.run_in_executor(
+                        self._executor,
+                        lambda: self._upload_blocking(data, bucket_name, blob_name, content_type)
+                    )
+            except BucketNotFound:
+                upload_failures.inc(bucket=bucket_name)
+                raise
+            except Exception as e:
+                upload_failures.inc(bucket=bucket_name)
+                if attempt == self.max_retries - 1:
+                    raise
+                delay = (2 ** attempt) * (0.5 + random.random())
+                logger.warning(f"GCS upload of {blob_name} failed (attempt {attempt + 1}/{self.max_retries}): {e}. "
+                               f"Retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            elapsed = time.perf_counter() - start
+            upload_seconds.observe(elapsed, bucket=bucket_name)
+            upload_bytes.inc(len(data), bucket=bucket_name)
+            self.uploads += 1
+            self.bytes_uploaded += len(data)
+            self.upload_time += elapsed
+            return url
+
+    def stats(self) -> dict:
+        return {
+            "uploads": self.uploads,
+            "bytes_uploaded": self.bytes_uploaded,
+            "avg_upload_seconds": round(self.upload_time / self.uploads, 3) if self.uploads else None,
+            "bytes_per_second": round(self.bytes_uploaded / self.upload_time) if self.upload_time else None,
+        }
+
+
+gcs_uploader = GCSUploader()
@@ -1,56 +1,58 @@
-from together import Together
 import uuid
 import datetime
 import os
 import logging
 import asyncio
-from together import AsyncTogether
 
-from google import genai
 from google.genai import types
-from google.cloud import storage 
 from io import BytesIO
 import concurrent.futures
 import time
 
+from lib.rate_limiter import get_rate_limiter, is_rate_limit_error
+from lib.image_cache import image_cache, image_cache_key
+from lib.gcs_uploader import gcs_uploader
+from lib.clients import genai_client, together_client, async_together_client
+from lib.tracing import record_stage, span
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Use a ThreadPoolExecutor with limited workers to prevent API overload
-executor = concurrent.futures.ThreadPoolExecutor(max_workers=5)
-
-# Initialize Together clients
-client = Together(api_key=os.getenv("TOGETHER_API_KEY"))
-async_client = AsyncTogether(api_key=os.environ.get("TOGETHER_API_KEY"))
-def get_gemini_client():
-    """Create and return a new Gemini client."""
-    return genai.Client(
-        vertexai=True,
-        project="thematic-land-451915-j3",
-        location="us-central1",
-    )
+# Threads for the blocking provider SDK calls; request rates are governed by lib/rate_limiter
+executor = concurrent.futures.ThreadPoolExecutor(max_workers=int(os.getenv("IMAGE_EXECUTOR_WORKERS", "8")))
 
-client_gemini = get_gemini_client()
-# Initialize image generation semaphore - limit concurrent requests
-semaphore = asyncio.Semaphore(1)  # Allow 1 concurrent image generation
-rate_limit_delay = 60/20
+# Imagen runs in its own project; clients come from the shared registry (lib/clients.py)
+IMAGEN_PROJECT = "thematic-land-451915-j3"
+IMAGEN_LOCATION = "us-central1"
+
+GEMINI_IMAGE_MODEL = "imagen-3.0-fast-generate-001"
+GEMINI_IMAGE_CONFIG = {"number_of_images": 1, "aspect_ratio": "1:1"}  # Also part of the image cache key
+FLUX_MODEL = "black-forest-labs/FLUX.1-schnell"
+FLUX_FREE_MODEL = "black-forest-labs/FLUX.1-schnell-free"
 # Define a placeholder image URL for error cases
 PLACEHOLDER_ERROR_IMAGE = "/placeholder-error.png"  # Local path to avoid Next.js domain issues
 
 async def generate_image_flux_async(prompt: str) -> str:
     """Asynchronously generate an image using the Together AI API."""
     loop = asyncio.get_running_loop()
+    limiter = get_rate_limiter("together", FLUX_MODEL)
     try:
-        image_response = await loop.run_in_executor(
-            executor,
-            lambda: client.images.generate(
-                prompt=prompt,
-                model="black-forest-labs/FLUX.1-schnell",
-                steps=14,
-                n=1,
-                height=1024,
-                width=1024,
-            )
-        )
+        async with limiter.acquire():
+            try:
+                image_response = await loop.run_in_executor(
+                    executor,
+                    lambda: together_client().images.generate(
+                        prompt=prompt,
+                        model=FLUX_MODEL,
+                        steps=14,
+                        n=1,
+                        height=1024,
+                        width=1024,
+                    )
+                )
+                limiter.record_success()
+            except Exception as e:
+                limiter.record_error(e)
+                raise
 
         if not image_response or not image_response.data:
             logging.warning("Empty response from Together AI")
@@ -65,22 +67,23 @@ async def generate_image_flux_async(prompt: str) -> str:
 
 async def generate_image_flux_free_async(prompt: str) -> str:
     """Asynchronously generate an image using the Together AI API with free tier."""
+    limiter = get_rate_limiter("together", FLUX_FREE_MODEL)
     try:
-        # Implement exponential backoff for rate limiting
+        # The limiter backs off on rate limit errors, so a retry simply waits for the next token
         max_retries = 3
-        retry_delay = 2  # Start with 2 seconds
         
         for attempt in range(max_retries):
             try:
-                response = await async_client.images.generate(
-                    model="black-forest-labs/FLUX.1-schnell-free",
-                    # model="black-forest-labs/FLUX.1-schnell",
-                    prompt=prompt,
-                    steps=4,
-                    n=1,
-                    height=512,
-                    width=512,
-                )
+                async with limiter.acquire():
+                    response = await async_together_client().images.generate(
+                        model=FLUX_FREE_MODEL,
+                        prompt=prompt,
+                        steps=4,
+                        n=1,
+                        height=512,
+                        width=512,
+                    )
+                limiter.record_success()
                 
                 if not response or not response.data:
                     logging.warning("Empty response from Together AI free tier")
@@ -89,10 +92,9 @@ async def generate_image_flux_free_async(prompt: str) -> str:
                 return response.data[0].url
                 
             except Exception as e:
-                if "rate limit" in str(e).lower() and attempt < max_retries - 1:
-                    wait_time = retry_delay * (2 ** attempt)
-                    logging.info(f"Rate limited, retrying in {wait_time} seconds (attempt {attempt+1}/{max_retries})")
-                    await asyncio.sleep(wait_time)
+                limiter.record_error(e)
+                if is_rate_limit_error(e) and attempt < max_retries - 1:
+                    logging.info(f"Rate limited, retrying (attempt {attempt+1}/{max_retries})")
                 else:
                     raise  # Re-raise if not a rate limit or we're out of retries
     
@@ -101,28 +103,30 @@ async def generate_image_flux_free_async(prompt: str) -> str:
         return PLACEHOLDER_ERROR_IMAGE  # Return placeholder on failure
 
 # 3
+def generate_image_gemini_once(prompt):
+    """Makes a single Imagen request. Returns image bytes, None on an empty response, and raises on API errors."""
+    response = genai_client(IMAGEN_PROJECT, IMAGEN_LOCATION).models.generate_images(
+        model=GEMINI_IMAGE_MODEL,
+        prompt=prompt,
+        config=types.GenerateImagesConfig(**GEMINI_IMAGE_CONFIG)
+    )
+
+    if response and response.generated_images:
+        return response.generated_images[0].image.image_bytes
+    logging.warning("Empty response from Gemini API")
+    return None
+
 def generate_image_gemini(prompt):
-    """Generates an image using the Gemini API with retry logic."""
+    """Generates an image using the Gemini API with retry logic (blocking, for scripts and notebooks)."""
     max_retries = 3
     retry_delay = 2  # Start with 2 seconds
     
     for attempt in range(max_retries):
         try:
             print(f"Generating image with Gemini... (attempt {attempt+1}/{max_retries})")
-
-            response = client_gemini.models.generate_images(
-                model='imagen-3.0-fast-generate-001',
-                prompt=prompt,
-                config=types.GenerateImagesConfig(
-                    number_of_images=1,
-                    aspect_ratio="1:1",
-                )
-            )
-            
-            if response and response.generated_images:
-                return response.generated_images[0].image.image_bytes
-            else:
-                logging.warning("Empty response from Gemini API")
+            image_bytes = generate_image_gemini_once(prompt)
+            if image_bytes:
+                return image_bytes
                 
         except Exception as e:
             logging.warning(f"Attempt {attempt+1} failed: {e}")
@@ -144,23 +148,8 @@ async def upload_image_gg_storage_async(image_bytes, bucket_name, prefix):
         
     try:
         blob_name = f"{prefix}{uuid.uuid4()}.png"
-        
-        # Use run_in_executor to make the synchronous GCS operations non-blocking
-        loop = asyncio.get_running_loop()
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(bucket_name)
-        
-        if not await loop.run_in_executor(None, bucket.exists):
-            logging.error(f"Bucket {bucket_name} does not exist.")
-            return PLACEHOLDER_ERROR_IMAGE
-            
-        blob = bucket.blob(blob_name)
-        await loop.run_in_executor(
-            None, 
-            lambda: blob.upload_from_string(image_bytes, content_type="image/png")
-        )
-        
-        return blob.public_url
+        # Shared uploader: one client, cached bucket handle, dedicated upload pool with retries
+        return await gcs_uploader.upload(image_bytes, bucket_name, blob_name, content_type="image/png")
     except Exception as e:
         logging.error(f"Error uploading image: {e}", exc_info=True)
         return PLACEHOLDER_ERROR_IMAGE
@@ -183,16 +172,48 @@ async def upload_image_gg_storage_async(image_bytes, bucket_name, prefix):
 #             return None
 
 async def generate_image_gemini_async(prompt):
-    """Generate an image using Gemini API asynchronously while enforcing rate limits."""
-    async with semaphore:  # Ensure requests are sequential
-        await asyncio.sleep(rate_limit_delay)  # Enforce a delay before making a new request
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, lambda: generate_image_gemini(prompt))
+    """Generate an image using Gemini API asynchronously, paced by the shared Imagen rate limiter."""
+    limiter = get_rate_limiter("gemini", GEMINI_IMAGE_MODEL)
+    loop = asyncio.get_running_loop()
+    max_retries = 3
+    retry_delay = 2
+
+    for attempt in range(max_retries):
+        try:
+            queued = time.perf_counter()
+            async with limiter.acquire():
+                record_stage("image_rate_limit_wait", time.perf_counter() - queued,
+                             provider="gemini", model=GEMINI_IMAGE_MODEL)
+                with span("image_render", provider="gemini", model=GEMINI_IMAGE_MODEL, attempt=attempt + 1):
+                    image_bytes = await loop.run_in_executor(executor, lambda: generate_image_gemini_once(prompt))
+            limiter.record_success()
+            if image_bytes:
+                return image_bytes
+        except Exception as e:
+            limiter.record_error(e)
+            logging.warning(f"Imagen attempt {attempt+1}/{max_retries} failed: {e}")
+            # Rate limit errors are paced by the limiter's cool-down; back off ourselves for anything else
+            if not is_rate_limit_error(e) and attempt < max_retries - 1:
+                await asyncio.sleep(retry_delay * (2 ** attempt))
+
+    logging.error("Failed to generate image after all retry attempts")
+    return None
     
 # 1
-async def generate_and_upload_async(prompt, prefix="gemini_image_", bucket_name="bucket_comic"):
-    """Generates an image and uploads it asynchronously, returning the public URL or placeholder."""
+async def generate_and_upload_async(prompt, prefix="gemini_image_", bucket_name="bucket_comic", use_cache=True):
+    """Generates an image and uploads it asynchronously, returning the public URL or placeholder.
+
+    Identical prompt/model/config renders are served from the image cache unless
+    `use_cache` is False (explicit re-roll), in which case the fresh render replaces the cached one.
+    """
     try:
+        cache_key = image_cache_key(prompt, GEMINI_IMAGE_MODEL, **GEMINI_IMAGE_CONFIG)
+        if use_cache:
+            cached_url = await image_cache.get(cache_key)
+            if cached_url:
+                logging.info(f"♻️ Image cache hit for prompt: {prompt[:40]}...")
+                return cached_url
+
         image_bytes = await generate_image_gemini_async(prompt)
         if image_bytes is None:
             logging.error(f"⚠️ Failed to generate image for prompt: {prompt}")
@@ -204,6 +225,9 @@ async def generate_and_upload_async(prompt, prefix="gemini_image_", bucket_name=
         # Ensure we don't return example.com URLs or other unconfigured domains
         if "example.com" in url or not url:
             return PLACEHOLDER_ERROR_IMAGE
+
+        if url != PLACEHOLDER_ERROR_IMAGE:
+            await image_cache.put(cache_key, url, GEMINI_IMAGE_MODEL)
             
         return url
     except Exception as e:
@@ -1,30 +1,22 @@
 
 from fastapi import HTTPException
-from openai import OpenAI
-import os
 import json
-import instructor
 from dotenv import load_dotenv
-from groq import Groq
-from google import genai
-from google.genai import types
-from google.oauth2 import service_account
-from .init_gemini import init_vertexai
+from lib.clients import (genai_client, openai_client, groq_client, deepseek_client,
+                         async_openai_client, async_groq_client, async_deepseek_client)
 # from ..models import Comic, ComicRequest, ComicResponse
 from models import ComicScript
-from lib.story import system_prompt_v1, system_prompt_v2, system_prompt_v3, system_prompt_v4, system_prompt_v5, system_prompt_v5_continue
+from lib.characters import character_matcher, characters_from_pages, expand_image_prompt
+from lib.prompts import prompts, PromptBudgetExceeded
+from lib.story import system_prompt_v4
 # Load environment variables
 load_dotenv()
 
 
-
-openai = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-groq_client = instructor.from_groq(Groq(), mode=instructor.Mode.JSON)
-
 def openai_text_generation(request):
     # Generate comic script using OpenAI
     try:
-        completion = openai.beta.chat.completions.parse(
+        completion = openai_client().beta.chat.completions.parse(
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": system_prompt_v4},
@@ -48,7 +40,7 @@ def openai_text_generation(request):
 def groq_text_generation(request):
     try:
         # Generate comic script using Groq
-        response = groq_client.chat.completions.create(
+        response = groq_client().chat.completions.create(
             model="llama-3.3-70b-versatile",
             # model="llama-3.1-8b-instant",
             response_model=ComicScript,
@@ -72,15 +64,10 @@ def groq_text_generation(request):
 
 def deepseek_text_generation(request):
     try:
-        client = OpenAI(
-            api_key=os.getenv("DEEPSEEK_API_KEY"),
-            base_url="https://api.deepseek.com",
-        )
-
         messages = [{"role": "system", "content": system_prompt_v4},
                     {"role": "user", "content": request.prompt}]
 
-        response = client.chat.completions.create(
+        response = deepseek_client().chat.completions.create(
             model="deepseek-chat",
             messages=messages,
             response_format={
@@ -94,26 +81,32 @@ def deepseek_text_generation(request):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Deepseek Error: {str(e)}")
 
+def _forget_rejected_cache(name, config):
+    """A failed call on a context cache may mean the cache is gone; the next request recreates it."""
+    if "cached_content" in config:
+        prompts.invalidate(name)
+
+
+def _gemini_generate(name, contents, config):
+    try:
+        response = genai_client().models.generate_content(model=prompts.model(name), contents=contents, config=config)
+    except Exception:
+        _forget_rejected_cache(name, config)
+        raise
+    prompts.log_usage(name, response.usage_metadata)
+    return response
+
+
 def gemini_text_generation(request):
     try:
         
-        client = genai.Client(
-            vertexai=True,
-            project=os.environ.get("PROJECT_ID"),
-            location=os.environ.get("LOCATION", "us-central1"),
-        )
         # Generate response using Gemini API
-        response = client.models.generate_content(
-            model='gemini-2.0-flash',
-            contents=request.prompt,
-            config={
-                'response_mime_type': 'application/json',
-                'response_schema': ComicScript,  # Use ComicScript as the expected schema
-                'system_instruction': types.Part.from_text(
-                    text=system_prompt_v5
-                ),
-            },
+        config = prompts.gemini_config(
+            "story", request.prompt,
+            response_mime_type='application/json',
+            response_schema=ComicScript,  # Use ComicScript as the expected schema
         )
+        response = _gemini_generate("story", request.prompt, config)
         # Extract structured response
     
         print('======text here', response.text)
@@ -121,29 +114,89 @@ def gemini_text_generation(request):
         
         
         return comic_data
+    except PromptBudgetExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Gemini API Error: {str(e)}")
 
+async def gemini_text_generation_stream(request):
+    """Streams a comic script from Gemini, yielding raw JSON text chunks as they arrive."""
+    config = prompts.gemini_config(
+        "story", request.prompt, response_mime_type='application/json', response_schema=ComicScript)
+    try:
+        stream = await genai_client().aio.models.generate_content_stream(
+            model=prompts.model("story"), contents=request.prompt, config=config)
+    except Exception:
+        _forget_rejected_cache("story", config)
+        raise
+    usage = None
+    async for chunk in stream:
+        usage = chunk.usage_metadata or usage
+        if chunk.text:
+            yield chunk.text
+    prompts.log_usage("story", usage)
+
+# Async variants used by lib/text_router.py. Same models and prompts as the functions above;
+# errors propagate as-is so the router can classify them.
+async def gemini_text_generation_async(request) -> dict:
+    config = prompts.gemini_config(
+        "story", request.prompt, response_mime_type='application/json', response_schema=ComicScript)
+    try:
+        response = await genai_client().aio.models.generate_content(
+            model=prompts.model("story"), contents=request.prompt, config=config)
+    except Exception:
+        _forget_rejected_cache("story", config)
+        raise
+    prompts.log_usage("story", response.usage_metadata)
+    return json.loads(response.text)
+
+async def openai_text_generation_async(request) -> dict:
+    prompts.check_budget("story_v4", request.prompt)
+    completion = await async_openai_client().beta.chat.completions.parse(
+        model="gpt-4o",
+        messages=[
+            {"role": "system", "content": system_prompt_v4},
+            {"role": "user", "content": request.prompt},
+        ],
+        response_format=ComicScript,
+    )
+    return completion.choices[0].message.parsed.model_dump()
+
+async def groq_text_generation_async(request) -> dict:
+    prompts.check_budget("story_v4", request.prompt)
+    response = await async_groq_client().chat.completions.create(
+        model="llama-3.3-70b-versatile",
+        response_model=ComicScript,
+        messages=[
+            {"role": "system", "content": system_prompt_v4},
+            {"role": "user", "content": request.prompt},
+        ],
+        temperature=0.65,
+    )
+    return response.model_dump()
+
+async def deepseek_text_generation_async(request) -> dict:
+    prompts.check_budget("story_v4", request.prompt)
+    response = await async_deepseek_client().chat.completions.create(
+        model="deepseek-chat",
+        messages=[{"role": "system", "content": system_prompt_v4},
+                  {"role": "user", "content": request.prompt}],
+        response_format={
+            'type': 'json_object'
+        }
+    )
+    return json.loads(response.choices[0].message.content)
+
 def gemini_text_generation_new(prompt):
     try:
         
-        client = genai.Client(
-            vertexai=True,
-            project=os.environ.get("PROJECT_ID"),
-            location=os.environ.get("LOCATION", "us-central1"),
-        )
         # Generate response using Gemini API
-        response = client.models.generate_content(
-            model='gemini-2.0-flash',
-            contents=prompt,
-            config={
-                'response_mime_type': 'application/json',
-                'response_schema': ComicScript,  # Use ComicScript as the expected schema
-                'system_instruction': types.Part.from_text(
-                    text=system_prompt_v5_continue
-                ),
-            },
+        config = prompts.gemini_config(
+            "story_continue", prompt,
+            response_mime_type='application/json',
+            response_schema=ComicScript,  # Use ComicScript as the expected schema
         )
+        response = _gemini_generate("story_continue", prompt, config)
         # Extract structured response
     
         print('======text here', response.text)
@@ -151,53 +204,56 @@ def gemini_text_generation_new(prompt):
         
         
         return comic_data
+    except PromptBudgetExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Gemini API Error: {str(e)}")
 
-import re
-# Function to ensure character descriptions remain consistent in new `image_prompt`
+# Character consistency helpers; the per-comic registry lives in lib/characters.py
 def ensure_character_consistency(image_prompt, character_descriptions):
     """
     Replaces character names in an image_prompt with their full descriptions for visual consistency.
     """
-    for char in character_descriptions:
-        name = char["name"]
-        full_description = f"Character: {name}, {char['description']}"
-        image_prompt = re.sub(fr"Character:\s*{re.escape(name)}\b", full_description, image_prompt)
-
-    return image_prompt
+    return expand_image_prompt(image_prompt, character_descriptions)
 # Extract unique character descriptions from previous pages' image_prompts
 def extract_character_descriptions(previous_pages):
     """
-    Extracts character descriptions from previous pages' image_prompts to ensure consistency.
+    Extracts character descriptions from previous pages' image_prompts (comics stored before `comic.characters`).
     """
-    character_descriptions = {}
+    return characters_from_pages(previous_pages)
 
-    for page in previous_pages:
-        if "image_prompt" in page:
-            matches = re.findall(r"Character:\s*([^,]+),\s*(.*?)(?=\s*\|\s*|$)", page["image_prompt"])
-            for name, description in matches:
-                character_descriptions[name.strip()] = {
-                    "name": name.strip(),
-                    "description": description.strip()
-                }
-
-    return list(character_descriptions.values())
-
-def generate_new_comic_pages(previous_pages, num_pages=3):
-    """Generate multiple new comic pages using AI with full context."""
-    
-    # Extract previous story in a structured format
-    previous_story = "\n\n".join([
-        f"Page {i+1}: {page['scene']}\n"
+def format_story_pages(pages, start=0):
+    """Pages in the structured form the continuation prompt uses, numbered from `start + 1`."""
+    return "\n\n".join([
+        f"Page {start+i+1}: {page['scene']}\n"
         f"Full Text: {page['text_full']}\n"
         f"Dialogue: " + " | ".join([f"{d['character']}: {d['text']}" for d in page.get('dialogue', [])]) + "\n"
         f"Final Transition: {page['final_transition']}"
-        for i, page in enumerate(previous_pages)
+        for i, page in enumerate(pages)
     ])
 
+def summarize_story(summary, pages, start, max_words=300):
+    """Folds `pages` (numbered from `start + 1`) into the running story summary and returns the new summary."""
+    contents = (f"Word limit: {max_words}\n\nCurrent summary:\n{summary or '(none)'}\n\n"
+                f"New pages:\n{format_story_pages(pages, start)}")
+    config = prompts.gemini_config("story_summary", contents)
+    response = _gemini_generate("story_summary", contents, config)
+    return response.text.strip()
+
+def generate_new_comic_pages(previous_pages, num_pages=3, previous_story=None, characters=None):
+    """Generate multiple new comic pages using AI with full context.
+
+    `previous_story` (see lib/story_context.py) replaces the verbatim text of every previous page, and
+    `characters` (the comic's stored registry) the scan of their image prompts, when given.
+    """
+    
+    # Extract previous story in a structured format
+    if previous_story is None:
+        previous_story = format_story_pages(previous_pages)
+
     # Get characters with their exact descriptions
-    characters = extract_character_descriptions(previous_pages)
+    if characters is None:
+        characters = extract_character_descriptions(previous_pages)
 
     # Generate the prompt for story continuation
     prompt = f"""
@@ -221,5 +277,10 @@ def generate_new_comic_pages(previous_pages, num_pages=3):
     print('==========starting new comic generation \n')
     # Convert AI response to structured JSON
     new_scenes = gemini_text_generation_new(prompt)['pages']
+
+    # Put the stored descriptions back into every image prompt, however the model abbreviated them
+    matcher = character_matcher(characters)
+    for scene in new_scenes:
+        scene['image_prompt'] = matcher.expand(scene['image_prompt'])
  
     return new_scenes
\ No newline at end of file
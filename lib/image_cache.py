@@ -0,0 +1,87 @@
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy.dialects.postgresql import insert
+
+from database import async_session
+from models import ImageCacheEntry
+
+logger = logging.getLogger(__name__)
+
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "2048"))  # Entries kept in the in-memory LRU
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapses whitespace so trivially different copies of a prompt share a cache entry."""
+    return " ".join(prompt.split())
+
+
+def image_cache_key(prompt: str, model: str, **config) -> str:
+    """Content address of a render: hash of the normalized prompt, model and render parameters."""
+    payload = json.dumps({"prompt": normalize_prompt(prompt), "model": model, "config": config},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ImageCache:
+    """Maps render hashes to uploaded image URLs: in-memory LRU in front of the image_cache table."""
+
+    def __init__(self, max_size: int = IMAGE_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lru: "OrderedDict[str, str]" = OrderedDict()
+
+    def _remember(self, key: str, url: str):
+        self._lru[key] = url
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+
+    def _lookup_local(self, key: str) -> Optional[str]:
+        url = self._lru.get(key)
+        if url is not None:
+            self._lru.move_to_end(key)
+        return url
+
+    async def get(self, key: str) -> Optional[str]:
+        url = self._lookup_local(key)
+        if url is not None:
+            self.hits += 1
+            return url
+
+        try:
+            async with async_session() as db:
+                entry = await db.get(ImageCacheEntry, key)
+                url = entry.url if entry else None
+        except Exception as e:
+            logger.warning(f"Image cache lookup failed: {e}")
+            url = None
+
+        if url is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._remember(key, url)
+        return url
+
+    async def put(self, key: str, url: str, model: str):
+        self._remember(key, url)
+        try:
+            async with async_session() as db:
+                stmt = insert(ImageCacheEntry).values(key=key, url=url, model=model, created_at=datetime.now())
+                await db.execute(stmt.on_conflict_do_update(index_elements=["key"], set_={"url": url}))
+                await db.commit()
+        except Exception as e:
+            logger.warning(f"Image cache write failed: {e}")
+
+    def stats(self) -> dict:
+        return {"size": len(self._lru), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
+image_cache = ImageCache()
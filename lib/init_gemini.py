@@ -1,49 +1,35 @@
 import os
-import json
-import tempfile
 # from google.oauth2 import service_account
 import vertexai
 
+from lib.clients import google_credentials, google_project, google_location, genai_client, storage_client
+from lib.prompts import prompts
+
 
 def init_vertexai():
     """Initialize Google Vertex AI with service account credentials on Render."""
     try:
-        # 1️⃣ Get the JSON string from environment variable
-        credentials_json_str = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS_JSON")
-        if not credentials_json_str:
+        # 1️⃣ Parse GOOGLE_APPLICATION_CREDENTIALS_JSON in memory (no temporary key file on disk)
+        if not os.environ.get("GOOGLE_APPLICATION_CREDENTIALS_JSON"):
             raise ValueError("GOOGLE_APPLICATION_CREDENTIALS_JSON environment variable not set.")
+        credentials = google_credentials()
 
-        # 2️⃣ Parse the JSON string
-        try:
-            credentials_json = json.loads(credentials_json_str)
-        except json.JSONDecodeError as e:
-            raise ValueError(f"Invalid JSON format in GOOGLE_APPLICATION_CREDENTIALS_JSON: {e}")
-
-        # 3️⃣ Ensure the 'private_key' is present
-        if "private_key" not in credentials_json:
-            raise ValueError("Missing 'private_key' in GOOGLE_APPLICATION_CREDENTIALS_JSON.")
-
-        # 4️⃣ Write credentials to a temporary JSON file
-        with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".json") as temp_file:
-            json.dump(credentials_json, temp_file)
-            temp_credentials_path = temp_file.name
-
-        print(f"✅ Credentials stored in temporary file: {temp_credentials_path}")
-
-        # 5️⃣ Set GOOGLE_APPLICATION_CREDENTIALS to use this file
-        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = temp_credentials_path
-
-        # 6️⃣ Retrieve Google Cloud project details
-        project_id = os.environ.get("PROJECT_ID")
-        location = os.environ.get("LOCATION", "us-central1")
+        # 2️⃣ Retrieve Google Cloud project details
+        project_id = google_project()
+        location = google_location()
         if not project_id:
             raise ValueError("PROJECT_ID environment variable not set.")
 
-        # 7️⃣ Initialize Vertex AI
-        vertexai.init(project=project_id, location=location)
+        # 3️⃣ Initialize Vertex AI with the shared credentials
+        vertexai.init(project=project_id, location=location, credentials=credentials)
+
+        # 4️⃣ Build the shared clients and prompt caches now so the first request doesn't pay for it
+        genai_client()
+        storage_client()
+        prompts.warm()
 
         print(f"✅ Successfully initialized Vertex AI for project: {project_id} (Region: {location})")
-       
+
         return True
 
     except Exception as e:
@@ -0,0 +1,296 @@
+import os
+import uuid
+import socket
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import text
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from database import async_session, async_commit
+from lib.retry import retry_async
+from lib.tracing import record_stage, set_comic, span
+from models import GenerationJob
+
+logger = logging.getLogger(__name__)
+
+# Queue tuning (override through environment variables)
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "120"))          # How long a claim is valid without a heartbeat
+JOB_HEARTBEAT_SECONDS = int(os.getenv("JOB_HEARTBEAT_SECONDS", "20"))   # How often a running job renews its lease
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1.0"))          # Idle sleep between claim attempts
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BASE_DELAY = int(os.getenv("JOB_RETRY_BASE_DELAY", "10"))     # Seconds, doubled on every attempt
+JOB_RETRY_MAX_DELAY = int(os.getenv("JOB_RETRY_MAX_DELAY", "300"))
+
+# A handler receives the claimed job row and a session owned by the worker
+JobHandler = Callable[[Dict[str, Any], AsyncSession], Awaitable[None]]
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler when another attempt would fail the same way; the job fails without retrying."""
+
+CLAIM_JOB_SQL = text("""
+    UPDATE generation_job
+    SET status = 'running',
+        attempts = attempts + 1,
+        locked_by = :worker_id,
+        lease_expires_at = now() + make_interval(secs => :lease),
+        heartbeat_at = now(),
+        started_at = now(),
+        updated_at = now()
+    WHERE id = (
+        SELECT id FROM generation_job
+        WHERE attempts < max_attempts
+          AND ((status = 'queued' AND run_after <= now())
+               OR (status = 'running' AND lease_expires_at < now()))
+        ORDER BY run_after, created_at
+        FOR UPDATE SKIP LOCKED
+        LIMIT 1
+    )
+    RETURNING id, kind, comic_id, payload, attempts, max_attempts,
+              EXTRACT(EPOCH FROM now() - run_after)::float AS queued_seconds
+""")
+
+HEARTBEAT_JOB_SQL = text("""
+    UPDATE generation_job
+    SET lease_expires_at = now() + make_interval(secs => :lease),
+        heartbeat_at = now(),
+        updated_at = now()
+    WHERE id = :job_id AND locked_by = :worker_id AND status = 'running'
+    RETURNING id
+""")
+
+COMPLETE_JOB_SQL = text("""
+    UPDATE generation_job
+    SET status = 'succeeded', locked_by = NULL, lease_expires_at = NULL, updated_at = now()
+    WHERE id = :job_id AND locked_by = :worker_id
+""")
+
+FAIL_JOB_SQL = text("""
+    UPDATE generation_job
+    SET status = CASE WHEN attempts < max_attempts AND NOT :permanent THEN 'queued' ELSE 'failed' END,
+        run_after = now() + make_interval(secs => :delay),
+        locked_by = NULL,
+        lease_expires_at = NULL,
+        last_error = :error,
+        updated_at = now()
+    WHERE id = :job_id AND locked_by = :worker_id
+    RETURNING status
+""")
+
+# Jobs whose worker died on the last attempt can no longer be claimed, so fail them explicitly
+REAP_EXPIRED_JOBS_SQL = text("""
+    UPDATE generation_job
+    SET status = 'failed', locked_by = NULL, lease_expires_at = NULL,
+        last_error = 'Lease expired on final attempt', updated_at = now()
+    WHERE status = 'running' AND lease_expires_at < now() AND attempts >= max_attempts
+    RETURNING id, kind, comic_id, payload, attempts, max_attempts
+""")
+
+QUEUE_COUNTS_SQL = text("""
+    SELECT kind, status, count(*) AS n
+    FROM generation_job
+    WHERE status IN ('queued', 'running')
+    GROUP BY kind, status
+""")
+
+
+def enqueue_job(db: AsyncSession, kind: str, comic_id: str, payload: Optional[dict] = None,
+                max_attempts: int = JOB_MAX_ATTEMPTS) -> GenerationJob:
+    """Adds a job to the session. The caller commits, so the job lands in the same transaction as the comic row."""
+    job = GenerationJob(kind=kind, comic_id=comic_id, payload=payload or {}, max_attempts=max_attempts)
+    db.add(job)
+    return job
+
+
+async def claim_job(db: AsyncSession, worker_id: str) -> Optional[Dict[str, Any]]:
+    """Claims the next runnable job (queued, or running with an expired lease) using SKIP LOCKED."""
+    result = await db.execute(CLAIM_JOB_SQL, {"worker_id": worker_id, "lease": JOB_LEASE_SECONDS})
+    row = result.mappings().first()
+    if not row:
+        await db.rollback()  # Nothing claimed; skip the commit (and its log line) on every idle poll
+        return None
+    await async_commit(db)
+    return dict(row)
+
+
+async def heartbeat_job(db: AsyncSession, job_id: str, worker_id: str) -> bool:
+    """Renews the lease on a running job. Returns False if this worker no longer owns it."""
+    result = await db.execute(HEARTBEAT_JOB_SQL, {"job_id": job_id, "worker_id": worker_id,
+                                                  "lease": JOB_LEASE_SECONDS})
+    row = result.first()
+    await async_commit(db)
+    return row is not None
+
+
+async def complete_job(db: AsyncSession, job_id: str, worker_id: str):
+    await db.execute(COMPLETE_JOB_SQL, {"job_id": job_id, "worker_id": worker_id})
+    await async_commit(db)
+
+
+async def fail_job(db: AsyncSession, job: Dict[str, Any], worker_id: str, error: str,
+                   permanent: bool = False) -> Optional[str]:
+    """Records a failed attempt. Returns the new status: 'queued' (will retry) or 'failed' (attempts exhausted
+    or `permanent`)."""
+    delay = min(JOB_RETRY_BASE_DELAY * (2 ** (job["attempts"] - 1)), JOB_RETRY_MAX_DELAY)
+    result = await db.execute(FAIL_JOB_SQL, {"job_id": job["id"], "worker_id": worker_id, "delay": delay,
+                                             "error": error[:2000], "permanent": permanent})
+    row = result.first()
+    await async_commit(db)
+    return row[0] if row else None
+
+
+async def reap_expired_jobs(db: AsyncSession) -> list:
+    """Fails running jobs whose lease expired on their final attempt and returns them."""
+    result = await db.execute(REAP_EXPIRED_JOBS_SQL)
+    rows = result.mappings().all()
+    await async_commit(db)
+    return [dict(row) for row in rows]
+
+
+async def get_queue_counts(db: AsyncSession) -> Dict[str, Dict[str, int]]:
+    """Returns {kind: {"queued": n, "running": n}} for unfinished jobs."""
+    counts: Dict[str, Dict[str, int]] = {}
+    result = await db.execute(QUEUE_COUNTS_SQL)
+    for kind, status, n in result.all():
+        counts.setdefault(kind, {"queued": 0, "running": 0})[status] = n
+    return counts
+
+
+async def _with_session(fn, *args):
+    """Runs a queue operation in its own short-lived session, retrying transient database errors."""
+    async def attempt():
+        async with async_session() as db:
+            return await fn(db, *args)
+    return await retry_async(attempt, f"job_queue.{fn.__name__}")
+
+
+class JobWorker:
+    """Runs up to `concurrency` jobs at a time from the generation_job table.
+
+    Any number of worker processes can run side by side; claims are coordinated
+    by `FOR UPDATE SKIP LOCKED` and leases are renewed by a heartbeat, so a job
+    held by a crashed worker is picked up again once its lease expires.
+    """
+
+    def __init__(self, handlers: Dict[str, JobHandler], concurrency: int = 2,
+                 worker_id: Optional[str] = None,
+                 on_failure: Optional[JobHandler] = None):
+        self.handlers = handlers
+        self.concurrency = concurrency
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.on_failure = on_failure
+        self.running_jobs: Dict[str, Dict[str, Any]] = {}
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        """Stops claiming new jobs; jobs already running are allowed to finish."""
+        self._stopping.set()
+
+    async def run(self):
+        logger.info(f"Job worker {self.worker_id} started with concurrency {self.concurrency}")
+        slots = [asyncio.create_task(self._slot()) for _ in range(self.concurrency)]
+        slots.append(asyncio.create_task(self._reaper()))
+        try:
+            await asyncio.gather(*slots)
+        finally:
+            logger.info(f"Job worker {self.worker_id} stopped")
+
+    async def _idle(self, seconds: float):
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _slot(self):
+        while not self._stopping.is_set():
+            try:
+                job = await _with_session(claim_job, self.worker_id)
+            except Exception as e:
+                logger.error(f"Error claiming job: {e}")
+                await self._idle(JOB_POLL_SECONDS * 5)
+                continue
+
+            if not job:
+                await self._idle(JOB_POLL_SECONDS)
+                continue
+
+            await self._run_job(job)
+
+    async def _reaper(self):
+        while not self._stopping.is_set():
+            try:
+                for job in await _with_session(reap_expired_jobs):
+                    logger.error(f"Job {job['id']} ({job['kind']}) lease expired on final attempt")
+                    await self._notify_failure(job)
+            except Exception as e:
+                logger.error(f"Error reaping expired jobs: {e}")
+            await self._idle(JOB_LEASE_SECONDS)
+
+    async def _heartbeat(self, job: Dict[str, Any], task: asyncio.Task):
+        while not task.done():
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            try:
+                owned = await _with_session(heartbeat_job, job["id"], self.worker_id)
+            except Exception as e:
+                logger.warning(f"Heartbeat failed for job {job['id']}: {e}")
+                continue
+            if not owned:
+                logger.error(f"Lost lease on job {job['id']}, cancelling it")
+                task.cancel()
+                return
+
+    async def _run_job(self, job: Dict[str, Any]):
+        handler = self.handlers.get(job["kind"])
+        logger.info(f"Worker {self.worker_id} running job {job['id']} ({job['kind']}) "
+                    f"for comic {job['comic_id']}, attempt {job['attempts']}/{job['max_attempts']}")
+        self.running_jobs[job["id"]] = job
+        set_comic(job["comic_id"])
+        if job.get("queued_seconds") is not None:
+            record_stage("job_queue_wait", max(0.0, job["queued_seconds"]), operation=job["kind"])
+        try:
+            if handler is None:
+                raise ValueError(f"No handler registered for job kind '{job['kind']}'")
+
+            async with async_session() as db:
+                with span("job", operation=job["kind"], job_id=job["id"], attempt=job["attempts"]):
+                    task = asyncio.create_task(handler(job, db))
+                    heartbeat = asyncio.create_task(self._heartbeat(job, task))
+                    try:
+                        await task
+                    finally:
+                        heartbeat.cancel()
+
+            await _with_session(complete_job, job["id"], self.worker_id)
+            logger.info(f"✅ Job {job['id']} completed")
+
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                raise  # The worker itself is shutting down; the lease will expire and the job is retried
+            # Lease was lost; whoever owns the job now is responsible for it
+            logger.warning(f"Job {job['id']} cancelled after losing its lease")
+        except Exception as e:
+            permanent = isinstance(e, PermanentJobError)
+            logger.error(f"❌ Job {job['id']} failed{' permanently' if permanent else ''}: {e}", exc_info=not permanent)
+            try:
+                status = await _with_session(fail_job, job, self.worker_id, repr(e), permanent)
+            except Exception as db_error:
+                logger.error(f"Failed to record failure for job {job['id']}: {db_error}")
+                return
+            if status == "failed":
+                await self._notify_failure(job)
+            else:
+                logger.info(f"Job {job['id']} will be retried")
+        finally:
+            self.running_jobs.pop(job["id"], None)
+            set_comic(None)
+
+    async def _notify_failure(self, job: Dict[str, Any]):
+        if self.on_failure is None:
+            return
+        try:
+            async with async_session() as db:
+                await self.on_failure(job, db)
+        except Exception as e:
+            logger.error(f"Failure callback for job {job['id']} raised: {e}")
@@ -0,0 +1,85 @@
+import json
+from typing import Any, Dict, List, Optional
+
+
+class ComicScriptStreamParser:
+    """Incrementally parses a streamed ComicScript JSON document.
+
+    Feed it raw text chunks as they arrive; every time an object inside the
+    top-level "pages" array closes, it is decoded and returned from `feed`.
+    Top-level string fields (title, summary) are captured as soon as they
+    complete. Works regardless of the order the model emits the keys in.
+    """
+
+    def __init__(self, array_key: str = "pages"):
+        self.array_key = array_key
+        self.buffer = ""
+        self.fields: Dict[str, Any] = {}
+        self.pages_emitted = 0
+
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._expect_key = False
+        self._key: Optional[str] = None
+        self._in_array = False
+        self._item_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[dict]:
+        """Consumes a chunk and returns the pages completed by it."""
+        self.buffer += chunk
+        pages = []
+        buffer = self.buffer
+
+        for i in range(self._pos, len(buffer)):
+            c = buffer[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._top_level_string(buffer[self._string_start:i + 1])
+                continue
+
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c == "{" or c == "[":
+                self._depth += 1
+                if self._depth == 1:
+                    self._expect_key = True
+                elif self._depth == 2 and c == "[" and self._key == self.array_key:
+                    self._in_array = True
+                elif self._depth == 3 and c == "{" and self._in_array:
+                    self._item_start = i
+            elif c == "}" or c == "]":
+                if self._depth == 3 and c == "}" and self._item_start is not None:
+                    pages.append(json.loads(buffer[self._item_start:i + 1]))
+                    self._item_start = None
+                    self.pages_emitted += 1
+                elif self._depth == 2 and c == "]":
+                    self._in_array = False
+                self._depth -= 1
+            elif c == "," and self._depth == 1:
+                self._expect_key = True
+
+        self._pos = len(buffer)
+        return pages
+
+    def _top_level_string(self, raw: str):
+        value = json.loads(raw)
+        if self._expect_key:
+            self._key = value
+            self._expect_key = False
+        elif self._key is not None:
+            self.fields[self._key] = value
+
+    def result(self) -> dict:
+        """Decodes the complete document once the stream has ended."""
+        return json.loads(self.buffer)
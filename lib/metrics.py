@@ -0,0 +1,163 @@
+import threading
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+# Latency buckets in seconds, from fast DB commits up to multi-minute generations
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+class Counter:
+    """Monotonically increasing value per label set."""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self.values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(_label_key(labels), 0)
+
+
+class Histogram:
+    """Cumulative bucket counts plus sum and count per label set."""
+
+    def __init__(self, name: str, documentation: str, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.values: Dict[LabelKey, dict] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def get(self, **labels) -> Optional[dict]:
+        return self.values.get(_label_key(labels))
+
+
+class Gauge:
+    """Current value per label set; `set_function` computes it at scrape time instead."""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self.values: Dict[LabelKey, float] = {}
+        self._function: Optional[Callable[[], float]] = None
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self.values[_label_key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float]):
+        self._function = function
+
+    def get(self, **labels) -> float:
+        if self._function is not None and not labels:
+            return self._function()
+        return self.values.get(_label_key(labels), 0)
+
+
+REGISTRY: Dict[str, object] = {}
+
+
+def counter(name: str, documentation: str) -> Counter:
+    """Returns the counter registered under `name`, creating it on first use."""
+    metric = REGISTRY.get(name)
+    if metric is None:
+        metric = REGISTRY[name] = Counter(name, documentation)
+    return metric
+
+
+def histogram(name: str, documentation: str, buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+    """Returns the histogram registered under `name`, creating it on first use."""
+    metric = REGISTRY.get(name)
+    if metric is None:
+        metric = REGISTRY[name] = Histogram(name, documentation, buckets)
+    return metric
+
+
+def gauge(name: str, documentation: str) -> Gauge:
+    """Returns the gauge registered under `name`, creating it on first use."""
+    metric = REGISTRY.get(name)
+    if metric is None:
+        metric = REGISTRY[name] = Gauge(name, documentation)
+    return metric
+
+
+# --- Prometheus text exposition (format 0.0.4) ------------------------------
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def render_prometheus() -> str:
+    """Every registered metric in the Prometheus text format, for GET /metrics."""
+    lines = []
+    for name in sorted(REGISTRY):
+        metric = REGISTRY[name]
+        kind = {Counter: "counter", Histogram: "histogram", Gauge: "gauge"}[type(metric)]
+        lines.append(f"# HELP {name} " + metric.documentation.replace("\\", "\\\\").replace("\n", "\\n"))
+        lines.append(f"# TYPE {name} {kind}")
+        if isinstance(metric, Gauge) and metric._function is not None:
+            try:
+                lines.append(f"{name} {_number(metric._function())}")
+            except Exception:
+                pass  # A failing callback must not break the scrape
+            continue
+        with metric._lock:
+            series = dict(metric.values)
+        for key, value in sorted(series.items()):
+            if isinstance(metric, Histogram):
+                for bound, count in zip(metric.buckets, value["buckets"]):
+                    lines.append(f"{name}_bucket{_labels(key, (('le', _number(bound)),))} {count}")
+                lines.append(f"{name}_bucket{_labels(key, (('le', '+Inf'),))} {value['count']}")
+                lines.append(f"{name}_sum{_labels(key)} {_number(value['sum'])}")
+                lines.append(f"{name}_count{_labels(key)} {value['count']}")
+            else:
+                lines.append(f"{name}{_labels(key)} {_number(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,216 @@
+"""Page storage for comics.
+
+Pages live either in the `comic.pages` JSONB document ("jsonb", the original
+layout) or as one row per page in the `comic_page` table ("rows"). Each comic
+records its layout in `comic.page_storage`; new comics use COMIC_PAGE_STORAGE.
+Everything that reads or writes pages goes through these helpers so callers
+(and `ComicResponse.pages`) don't depend on the layout. Every write also bumps
+`comic.version` and `comic.updated_at`, which back the ETag of GET /comic/{id}.
+
+Existing comics can be moved to rows with:
+
+    python -m lib.page_store --migrate
+"""
+import os
+import json
+import asyncio
+import logging
+import argparse
+from typing import Dict, List, Sequence
+
+from sqlalchemy import func, text
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from database import init_db, run_transaction
+from models import Comic, ComicPageRecord
+
+logger = logging.getLogger(__name__)
+
+PAGE_STORAGE_MODE = os.getenv("COMIC_PAGE_STORAGE", "jsonb")  # Layout for new comics: "jsonb" or "rows"
+
+# Rewrites the pages document once, patching image_url on every page listed in :urls ({"<page_index>": "<url>"}).
+# Comics stored as rows get a single-row update per page instead and keep their (empty) document.
+UPDATE_IMAGE_URLS_SQL = text("""
+WITH urls AS (
+    SELECT page_index::int AS page_index, url
+    FROM jsonb_each_text(CAST(:urls AS jsonb)) AS u(page_index, url)
+), page_rows AS (
+    UPDATE comic_page AS p
+    SET image_url = urls.url
+    FROM urls
+    WHERE p.comic_id = :comic_id AND p.page_index = urls.page_index
+)
+UPDATE comic
+SET pages = CASE WHEN page_storage = 'rows' THEN pages ELSE (
+        SELECT COALESCE(jsonb_agg(
+                   CASE WHEN urls.url IS NULL THEN p.page
+                        ELSE jsonb_set(p.page, '{image_url}', to_jsonb(urls.url)) END
+                   ORDER BY p.idx), '[]'::jsonb)
+        FROM jsonb_array_elements(comic.pages) WITH ORDINALITY AS p(page, idx)
+        LEFT JOIN urls ON urls.page_index = p.idx - 1
+    ) END,
+    version = version + 1,
+    updated_at = now()
+WHERE id = :comic_id
+RETURNING version
+""")
+
+APPEND_PAGES_SQL = text("""
+UPDATE comic
+SET pages = COALESCE(pages, '[]'::jsonb) || CAST(:pages AS jsonb),
+    version = version + 1,
+    updated_at = now()
+WHERE id = :comic_id
+""")
+
+REPLACE_PAGES_SQL = text("""
+UPDATE comic
+SET pages = CAST(:pages AS jsonb), version = version + 1, updated_at = now()
+WHERE id = :comic_id
+""")
+
+TOUCH_COMIC_SQL = text("""
+UPDATE comic SET version = version + 1, updated_at = now()
+WHERE id = :comic_id
+RETURNING version
+""")
+
+DELETE_PAGE_ROWS_SQL = text("DELETE FROM comic_page WHERE comic_id = :comic_id")
+
+# Moves a batch of finished comics from the JSONB document to comic_page rows
+MIGRATE_BATCH_SQL = text("""
+WITH batch AS (
+    SELECT id, pages FROM comic
+    WHERE page_storage = 'jsonb' AND status <> 'processing'
+    ORDER BY id
+    LIMIT :batch_size
+    FOR UPDATE SKIP LOCKED
+), inserted AS (
+    INSERT INTO comic_page (comic_id, page_index, page, image_url)
+    SELECT batch.id, p.idx - 1, p.page - 'image_url', p.page ->> 'image_url'
+    FROM batch, jsonb_array_elements(COALESCE(batch.pages, '[]'::jsonb)) WITH ORDINALITY AS p(page, idx)
+    ON CONFLICT (comic_id, page_index) DO NOTHING
+)
+UPDATE comic
+SET page_storage = 'rows', pages = '[]'::jsonb
+FROM batch
+WHERE comic.id = batch.id
+RETURNING comic.id
+""")
+
+
+# First page's image_url for either layout, without loading the pages (rows-mode comics keep an empty document)
+COVER_IMAGE_URL = func.coalesce(
+    Comic.pages[0]["image_url"].astext,
+    select(ComicPageRecord.image_url)
+    .where(ComicPageRecord.comic_id == Comic.id, ComicPageRecord.page_index == 0)
+    .scalar_subquery(),
+).label("cover_image_url")
+
+
+def _page_row(comic_id: str, page_index: int, page: dict) -> ComicPageRecord:
+    content = {key: value for key, value in page.items() if key != "image_url"}
+    return ComicPageRecord(comic_id=comic_id, page_index=page_index, page=content, image_url=page.get("image_url"))
+
+
+def _row_page(row: ComicPageRecord) -> dict:
+    return {**row.page, "image_url": row.image_url}
+
+
+async def load_pages(db: AsyncSession, comic: Comic) -> List[dict]:
+    """Returns the comic's pages as the list of dicts exposed by ComicResponse.pages."""
+    if comic.page_storage != "rows":
+        return comic.pages or []
+    result = await db.exec(
+        select(ComicPageRecord)
+        .where(ComicPageRecord.comic_id == comic.id)
+        .order_by(ComicPageRecord.page_index)
+        .execution_options(populate_existing=True)  # image_url may have changed through raw SQL
+    )
+    return [_row_page(row) for row in result.all()]
+
+
+async def load_pages_many(db: AsyncSession, comics: Sequence[Comic]) -> Dict[str, List[dict]]:
+    """Like load_pages for a list of comics, with one query for all row-stored comics."""
+    pages = {comic.id: comic.pages or [] for comic in comics if comic.page_storage != "rows"}
+    row_ids = [comic.id for comic in comics if comic.page_storage == "rows"]
+    if row_ids:
+        result = await db.exec(
+            select(ComicPageRecord)
+            .where(ComicPageRecord.comic_id.in_(row_ids))
+            .order_by(ComicPageRecord.comic_id, ComicPageRecord.page_index)
+            .execution_options(populate_existing=True)
+        )
+        for comic_id in row_ids:
+            pages[comic_id] = []
+        for row in result.all():
+            pages[row.comic_id].append(_row_page(row))
+    return pages
+
+
+async def touch_comic(db: AsyncSession, comic_id: str) -> int:
+    """Bumps version and updated_at after a write that doesn't go through these helpers. Returns the new version.
+
+    The caller commits.
+    """
+    result = await db.execute(TOUCH_COMIC_SQL, {"comic_id": comic_id})
+    return result.scalar_one()
+
+
+async def replace_pages(db: AsyncSession, comic: Comic, pages: List[dict]):
+    """Replaces all pages of a comic. The caller commits."""
+    if comic.page_storage == "rows":
+        await db.execute(DELETE_PAGE_ROWS_SQL, {"comic_id": comic.id})
+        db.add_all([_page_row(comic.id, idx, page) for idx, page in enumerate(pages)])
+        await touch_comic(db, comic.id)
+    else:
+        await db.execute(REPLACE_PAGES_SQL, {"comic_id": comic.id, "pages": json.dumps(pages)})
+
+
+async def append_pages(db: AsyncSession, comic: Comic, pages: List[dict], start_idx: int):
+    """Appends pages starting at `start_idx` (the current page count). Row storage makes this a plain insert."""
+    if comic.page_storage == "rows":
+        db.add_all([_page_row(comic.id, start_idx + i, page) for i, page in enumerate(pages)])
+        await touch_comic(db, comic.id)
+    else:
+        await db.execute(APPEND_PAGES_SQL, {"comic_id": comic.id, "pages": json.dumps(pages)})
+
+
+async def update_image_urls(db: AsyncSession, comic_id: str, image_urls: Dict[int, str]) -> int:
+    """Sets image_url on several pages in a single parameterized statement. Returns the comic's new version.
+
+    The caller commits.
+    """
+    urls = json.dumps({str(idx): url for idx, url in image_urls.items()})
+    result = await db.execute(UPDATE_IMAGE_URLS_SQL, {"comic_id": comic_id, "urls": urls})
+    return result.scalar_one()
+
+
+async def migrate_to_rows(batch_size: int = 200) -> int:
+    """Moves every finished JSONB comic to comic_page rows, one committed batch at a time."""
+    total = 0
+    async def migrate_batch(db: AsyncSession) -> int:
+        result = await db.execute(MIGRATE_BATCH_SQL, {"batch_size": batch_size})
+        return len(result.all())
+
+    while True:
+        migrated = await run_transaction(migrate_batch, "page_store.migrate_batch")
+        total += migrated
+        logger.info(f"Migrated {migrated} comics to row storage ({total} total)")
+        if migrated < batch_size:
+            return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Comic page storage maintenance")
+    parser.add_argument("--migrate", action="store_true", help="Move finished JSONB comics to comic_page rows")
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.migrate:
+        init_db()
+        asyncio.run(migrate_to_rows(args.batch_size))
+    else:
+        parser.print_help()
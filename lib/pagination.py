@@ -0,0 +1,50 @@
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+from models import Comic
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(created_at: datetime, comic_id: str) -> str:
+    """Opaque cursor pointing just past (created_at, id) in a newest-first listing."""
+    raw = f"{created_at.isoformat()}|{comic_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        created_at, comic_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), comic_id
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def cursor_param(cursor: Optional[str] = None) -> Optional[Tuple[datetime, str]]:
+    """FastAPI dependency for the `cursor` query parameter; a malformed cursor is a 400."""
+    return decode_cursor(cursor) if cursor else None
+
+
+def paginate_newest_first(query, cursor: Optional[Tuple[datetime, str]], limit: int):
+    """Orders `query` by (created_at, id) descending and resumes after the decoded `cursor`.
+
+    Fetches one extra row so the caller can tell whether there is a next page (see `next_cursor`).
+    """
+    if cursor:
+        created_at, comic_id = cursor
+        query = query.where(tuple_(Comic.created_at, Comic.id) < tuple_(created_at, comic_id))
+    return query.order_by(Comic.created_at.desc(), Comic.id.desc()).limit(limit + 1)
+
+
+def next_cursor(rows: list, limit: int) -> Tuple[list, Optional[str]]:
+    """Trims the extra row fetched by `paginate_newest_first` and returns (rows, cursor for the next page)."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last.created_at, last.id)
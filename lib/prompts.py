@@ -0,0 +1,200 @@
+"""Prompt templates for the large system prompts in lib/story.py.
+
+Each system prompt is registered once with the model it is sent to. For Gemini the
+registry keeps a Vertex AI context cache of the system instruction, so a request
+sends `cached_content` instead of the whole prompt; when caching isn't available
+(prompt below PROMPT_CACHE_MIN_TOKENS, API error, PROMPT_CACHE_ENABLED=false) the
+prompt goes inline as before. Caches are created by `warm()` at startup and kept
+fresh by `run_cache_refresher()`, never on the request path.
+
+Every assembled request is token-counted and logged, and one that would exceed
+PROMPT_TOKEN_BUDGET is refused before anything is sent:
+
+    config = prompts.gemini_config("story", request.prompt, response_schema=ComicScript)
+    response = await genai_client().aio.models.generate_content(model=prompts.model("story"),
+                                                                contents=request.prompt, config=config)
+    prompts.log_usage("story", response.usage_metadata)
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+from typing import Dict, Optional
+
+from google.genai import types
+
+from lib.clients import genai_client
+from lib.metrics import counter
+from lib.story import system_prompt_v4, system_prompt_v5, system_prompt_v5_continue, system_prompt_summary
+
+logger = logging.getLogger(__name__)
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "0"))                      # Max input tokens per request, 0 = no limit
+PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "true").lower() == "true"
+PROMPT_CACHE_TTL_SECONDS = int(os.getenv("PROMPT_CACHE_TTL_SECONDS", "3600"))
+PROMPT_CACHE_MIN_TOKENS = int(os.getenv("PROMPT_CACHE_MIN_TOKENS", "4096"))            # Vertex AI minimum for an explicit context cache
+PROMPT_CACHE_RETRY_SECONDS = int(os.getenv("PROMPT_CACHE_RETRY_SECONDS", "600"))       # Back off after a failed create
+PROMPT_CACHE_REFRESH_MARGIN = 60  # Seconds before expiry that a cache is replaced rather than used
+PROMPT_CACHE_CHECK_SECONDS = 30   # How often the background refresher looks for missing/expiring caches (< the margin)
+CHARS_PER_TOKEN = 4  # Estimate for text that hasn't been counted by the provider
+
+prompt_tokens = counter("prompt_tokens_total", "Input tokens reported by the provider, by template and kind")
+prompt_budget_rejections = counter("prompt_budget_rejections_total", "Requests refused for exceeding PROMPT_TOKEN_BUDGET")
+
+
+class PromptBudgetExceeded(Exception):
+    pass
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class PromptTemplate:
+    """A system prompt, the model it is sent to, and its Gemini context cache."""
+
+    def __init__(self, name: str, system_prompt: str, model: str, cacheable: bool = False):
+        self.name = name
+        self.system_prompt = system_prompt
+        self.model = model
+        self.cacheable = cacheable
+        self.system_tokens: Optional[int] = None  # Counted once by the provider
+        self.cache_name: Optional[str] = None
+        self.cache_expires = 0.0
+        self.cache_retry_at = 0.0
+        self.lock = threading.Lock()
+
+    def cached_content(self) -> Optional[str]:
+        """Name of a live context cache for this prompt, if one exists."""
+        if self.cache_name and time.time() < self.cache_expires - PROMPT_CACHE_REFRESH_MARGIN:
+            return self.cache_name
+        return None
+
+    def needs_setup(self) -> bool:
+        if self.system_tokens is None:
+            return True
+        return (self.cacheable and PROMPT_CACHE_ENABLED and self.cached_content() is None
+                and self.system_tokens >= PROMPT_CACHE_MIN_TOKENS and time.time() >= self.cache_retry_at)
+
+
+class PromptRegistry:
+    def __init__(self):
+        self.templates: Dict[str, PromptTemplate] = {}
+
+    def register(self, name: str, system_prompt: str, model: str, cacheable: bool = False) -> PromptTemplate:
+        template = self.templates[name] = PromptTemplate(name, system_prompt, model, cacheable)
+        return template
+
+    def get(self, name: str) -> PromptTemplate:
+        return self.templates[name]
+
+    def model(self, name: str) -> str:
+        return self.templates[name].model
+
+    def system_prompt(self, name: str) -> str:
+        return self.templates[name].system_prompt
+
+    # --- Setup: token count and context cache, done once per template -------
+
+    def _setup(self, template: PromptTemplate):
+        with template.lock:
+            if template.system_tokens is None:
+                template.system_tokens = self._count_system_tokens(template)
+            if template.needs_setup():
+                self._create_cache(template)
+
+    def _count_system_tokens(self, template: PromptTemplate) -> int:
+        if template.cacheable:
+            try:
+                response = genai_client().models.count_tokens(model=template.model, contents=template.system_prompt)
+                return response.total_tokens
+            except Exception as e:
+                logger.warning(f"Token count for prompt {template.name} failed, estimating: {e}")
+        return estimate_tokens(template.system_prompt)
+
+    def _create_cache(self, template: PromptTemplate):
+        try:
+            cache = genai_client().caches.create(
+                model=template.model,
+                config=types.CreateCachedContentConfig(
+                    display_name=f"comicai-{template.name}",
+                    system_instruction=template.system_prompt,
+                    ttl=f"{PROMPT_CACHE_TTL_SECONDS}s",
+                ),
+            )
+        except Exception as e:
+            template.cache_retry_at = time.time() + PROMPT_CACHE_RETRY_SECONDS
+            logger.warning(f"Context caching unavailable for prompt {template.name}, sending it inline: {e}")
+            return
+        template.cache_name = cache.name
+        template.cache_expires = cache.expire_time.timestamp() if cache.expire_time else \
+            time.time() + PROMPT_CACHE_TTL_SECONDS
+        logger.info(f"✅ Cached prompt {template.name} ({template.system_tokens} tokens) as {cache.name}")
+
+    def warm(self):
+        """Counts and caches the Gemini prompts (blocking); also replaces caches that are about to expire."""
+        for template in self.templates.values():
+            if template.cacheable and template.needs_setup():
+                self._setup(template)
+
+    async def run_cache_refresher(self):
+        """Keeps the context caches warm in the background until cancelled."""
+        while True:
+            await asyncio.sleep(PROMPT_CACHE_CHECK_SECONDS)
+            try:
+                await asyncio.to_thread(self.warm)
+            except Exception as e:
+                logger.warning(f"Prompt cache refresh failed: {e}")
+
+    def invalidate(self, name: str):
+        """Forget the context cache, e.g. after the provider rejected it; the next request recreates it."""
+        template = self.templates[name]
+        template.cache_name = None
+        template.cache_expires = 0.0
+
+    # --- Per request --------------------------------------------------------
+
+    def check_budget(self, name: str, contents: str) -> int:
+        """Logs the input tokens of a request and raises PromptBudgetExceeded if it is over budget."""
+        template = self.templates[name]
+        system_tokens = template.system_tokens if template.system_tokens is not None else \
+            estimate_tokens(template.system_prompt)
+        total = system_tokens + estimate_tokens(contents)
+        logger.info(f"Prompt {name}: ~{total} input tokens ({system_tokens} system"
+                    f"{', cached' if template.cached_content() else ''})")
+        if PROMPT_TOKEN_BUDGET and total > PROMPT_TOKEN_BUDGET:
+            prompt_budget_rejections.inc(template=name)
+            raise PromptBudgetExceeded(f"Prompt {name} needs ~{total} input tokens, over the budget of {PROMPT_TOKEN_BUDGET}")
+        return total
+
+    def gemini_config(self, name: str, contents: str, **config) -> dict:
+        """generate_content config for `contents` under template `name`; uses the cache only if one is live."""
+        template = self.templates[name]
+        self.check_budget(name, contents)
+        cache_name = template.cached_content()
+        if cache_name:
+            return {**config, "cached_content": cache_name}
+        return {**config, "system_instruction": types.Part.from_text(text=template.system_prompt)}
+
+    def log_usage(self, name: str, usage):
+        """Records the provider's own token counts for a finished request."""
+        if usage is None:
+            return
+        prompt_count = usage.prompt_token_count or 0
+        cached_count = usage.cached_content_token_count or 0
+        prompt_tokens.inc(prompt_count - cached_count, template=name, kind="uncached")
+        prompt_tokens.inc(cached_count, template=name, kind="cached")
+        logger.info(f"Prompt {name}: {prompt_count} input tokens ({cached_count} cached), "
+                    f"{usage.candidates_token_count or 0} output tokens")
+
+    def snapshot(self) -> dict:
+        return {name: {"model": t.model, "system_tokens": t.system_tokens, "cached_content": t.cached_content()}
+                for name, t in self.templates.items()}
+
+
+prompts = PromptRegistry()
+prompts.register("story", system_prompt_v5, "gemini-2.0-flash", cacheable=True)
+prompts.register("story_continue", system_prompt_v5_continue, "gemini-2.0-flash", cacheable=True)
+prompts.register("story_v4", system_prompt_v4, "gpt-4o")
+prompts.register("story_summary", system_prompt_summary, "gemini-2.0-flash")
@@ -0,0 +1,147 @@
+"""Comic event pub/sub shared by every API and worker process.
+
+Publishers (request handlers, embedded or standalone workers) call `pubsub.publish`.
+Each API process starts a listener that hands every event to its local WebSocket hub,
+so a client hears about a comic no matter which process generated it.
+
+PUBSUB_BACKEND selects the transport:
+  postgres  LISTEN/NOTIFY on the application database (default)
+  memory    in-process delivery, for tests and single-process development
+"""
+import os
+import json
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional
+
+import asyncpg
+from sqlalchemy import text
+
+from database import ASYNC_DATABASE_URL, ASYNC_CONNECT_ARGS, async_session
+from lib.tracing import span
+
+logger = logging.getLogger(__name__)
+
+PUBSUB_BACKEND = os.getenv("PUBSUB_BACKEND", "postgres")
+PUBSUB_CHANNEL = os.getenv("PUBSUB_CHANNEL", "comic_events")
+PUBSUB_RECONNECT_SECONDS = 2
+
+# NOTIFY payloads are limited to 8000 bytes by default
+MAX_NOTIFY_PAYLOAD = 7900
+
+Handler = Callable[[List[str], dict], Awaitable[None]]
+
+
+def _encode(topics: List[str], message: dict) -> str:
+    payload = json.dumps({"topics": list(topics), "message": message}, default=str)
+    if len(payload.encode("utf-8")) <= MAX_NOTIFY_PAYLOAD:
+        return payload
+    # Too large to notify: tell subscribers to refetch the comic instead
+    logger.warning(f"Event {message.get('type')} for {message.get('comic_id')} exceeds the NOTIFY limit, "
+                   f"sending comic_changed")
+    return json.dumps({"topics": list(topics),
+                       "message": {"comic_id": message.get("comic_id"), "type": "comic_changed"}})
+
+
+class InMemoryPubSub:
+    """Delivers events to the handler of this process only."""
+
+    def __init__(self):
+        self.handler: Optional[Handler] = None
+
+    async def start(self, handler: Handler):
+        self.handler = handler
+
+    async def stop(self):
+        self.handler = None
+
+    async def publish(self, topics: List[str], message: dict):
+        if self.handler is None:
+            return
+        # Round-trip through JSON so tests see exactly what the Postgres backend would deliver
+        with span("broadcast", backend="memory", event=message.get("type"), comic_id=message.get("comic_id")):
+            event = json.loads(_encode(topics, message))
+            await self.handler(event["topics"], event["message"])
+
+
+class PostgresPubSub:
+    """Publishes with pg_notify and relays notifications from a dedicated LISTEN connection."""
+
+    def __init__(self, channel: str = PUBSUB_CHANNEL):
+        self.channel = channel
+        self.handler: Optional[Handler] = None
+        self._tasks: List[asyncio.Task] = []
+        self._connection: Optional[asyncpg.Connection] = None
+        self._events: Optional[asyncio.Queue] = None
+
+    async def start(self, handler: Handler):
+        self.handler = handler
+        self._events = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._listen()), asyncio.create_task(self._dispatch())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def publish(self, topics: List[str], message: dict):
+        """Sends the event to every listening process. Failures are logged, never raised into generation."""
+        try:
+            with span("broadcast", backend="postgres", event=message.get("type"), comic_id=message.get("comic_id")):
+                async with async_session() as db:
+                    await db.execute(text("SELECT pg_notify(:channel, :payload)"),
+                                     {"channel": self.channel, "payload": _encode(topics, message)})
+                    await db.commit()
+        except Exception as e:
+            logger.error(f"Failed to publish {message.get('type')} event: {e}")
+
+    def _dsn(self) -> str:
+        return ASYNC_DATABASE_URL.set(drivername="postgresql").render_as_string(hide_password=False)
+
+    async def _listen(self):
+        """Holds a LISTEN connection open, reconnecting after errors."""
+        while True:
+            try:
+                self._connection = await asyncpg.connect(self._dsn(), **ASYNC_CONNECT_ARGS)
+                lost = asyncio.Event()
+                self._connection.add_termination_listener(lambda _: lost.set())
+                await self._connection.add_listener(self.channel, self._on_notify)
+                logger.info(f"Listening for comic events on channel {self.channel}")
+                await lost.wait()
+                logger.warning("Comic event listener connection lost, reconnecting")
+            except asyncio.CancelledError:
+                if self._connection and not self._connection.is_closed():
+                    await self._connection.close()
+                raise
+            except Exception as e:
+                logger.error(f"Comic event listener error: {e}")
+            await asyncio.sleep(PUBSUB_RECONNECT_SECONDS)
+
+    def _on_notify(self, connection, pid, channel, payload: str):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.error(f"Ignoring malformed comic event: {payload[:200]}")
+            return
+        self._events.put_nowait(event)
+
+    async def _dispatch(self):
+        """Hands events to the handler one at a time, so clients see them in publish order."""
+        while True:
+            event = await self._events.get()
+            try:
+                await self.handler(event["topics"], event["message"])
+            except Exception as e:
+                logger.error(f"Error relaying comic event: {e}")
+
+
+def create_pubsub(backend: str = PUBSUB_BACKEND):
+    if backend == "memory":
+        return InMemoryPubSub()
+    if backend == "postgres":
+        return PostgresPubSub()
+    raise ValueError(f"Unknown PUBSUB_BACKEND: {backend}")
+
+
+pubsub = create_pubsub()
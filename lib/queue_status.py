@@ -0,0 +1,200 @@
+"""Generation queue introspection and per-comic ETAs.
+
+`queue_status(db)` reports, per stage of the pipeline:
+
+    jobs      queued / running / retrying per job kind, oldest wait, throughput
+              and run-time percentiles over the last QUEUE_STATUS_WINDOW_SECONDS
+    text      script generations in flight per provider, with router latencies
+    images    renders waiting on and holding each provider's rate limiter
+    uploads   GCS uploads in flight
+
+`comic_eta(db, comic)` turns that into an estimate for one comic: its position in
+the queue divided by recent throughput, then the remaining text and image time
+from the observed stage latencies (falling back to the job-level p50).
+
+Job counts and run times come from generation_job and cover every worker. In-flight
+counts, rate limiters and stage latencies are per process, so with separate worker
+processes they describe the API process and its embedded worker only.
+"""
+import os
+import math
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import text
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from lib.page_store import load_pages
+from lib.rate_limiter import rate_limiter_stats
+from lib.text_router import text_router
+from lib.tracing import in_flight_snapshot, stage_percentile, stage_snapshot
+from models import Comic
+
+QUEUE_STATUS_WINDOW_SECONDS = int(os.getenv("QUEUE_STATUS_WINDOW_SECONDS", "900"))  # Throughput/latency lookback
+
+QUEUE_SUMMARY_SQL = text("""
+    SELECT kind,
+           count(*) FILTER (WHERE status = 'queued' AND run_after <= now()) AS queued,
+           count(*) FILTER (WHERE status = 'queued' AND run_after > now()) AS retrying,
+           count(*) FILTER (WHERE status = 'running') AS running,
+           EXTRACT(EPOCH FROM now() - min(run_after) FILTER (
+               WHERE status = 'queued' AND run_after <= now()))::float AS oldest_queued_seconds,
+           count(*) FILTER (WHERE status = 'succeeded' AND updated_at > now() - make_interval(secs => :window)) AS succeeded,
+           count(*) FILTER (WHERE status = 'failed' AND updated_at > now() - make_interval(secs => :window)) AS failed,
+           percentile_cont(0.5) WITHIN GROUP (ORDER BY EXTRACT(EPOCH FROM updated_at - started_at)) FILTER (
+               WHERE status = 'succeeded' AND started_at IS NOT NULL) AS run_p50,
+           percentile_cont(0.95) WITHIN GROUP (ORDER BY EXTRACT(EPOCH FROM updated_at - started_at)) FILTER (
+               WHERE status = 'succeeded' AND started_at IS NOT NULL) AS run_p95,
+           percentile_cont(0.5) WITHIN GROUP (ORDER BY EXTRACT(EPOCH FROM started_at - run_after)) FILTER (
+               WHERE started_at > now() - make_interval(secs => :window)) AS queue_wait_p50
+    FROM generation_job
+    WHERE status IN ('queued', 'running') OR updated_at > now() - make_interval(secs => :window)
+    GROUP BY kind
+""")
+
+ACTIVE_WORKERS_SQL = text("SELECT count(DISTINCT locked_by) FROM generation_job WHERE status = 'running'")
+
+# The newest unfinished job of a comic (an extension queues a new job while the old one may still be retrying)
+COMIC_JOB_SQL = text("""
+    SELECT id, kind, status, attempts, max_attempts, payload, run_after, created_at,
+           EXTRACT(EPOCH FROM now() - started_at)::float AS running_seconds,
+           GREATEST(EXTRACT(EPOCH FROM run_after - now()), 0)::float AS retry_in_seconds
+    FROM generation_job
+    WHERE comic_id = :comic_id AND status IN ('queued', 'running')
+    ORDER BY created_at DESC
+    LIMIT 1
+""")
+
+# Same ordering as CLAIM_JOB_SQL in lib/job_queue.py
+JOBS_AHEAD_SQL = text("""
+    SELECT count(*) FROM generation_job
+    WHERE status = 'queued' AND attempts < max_attempts
+      AND (run_after, created_at) < (:run_after, :created_at)
+""")
+
+
+def _round(value: Optional[float], digits: int = 2) -> Optional[float]:
+    return round(value, digits) if value is not None else None
+
+
+async def job_summary(db: AsyncSession) -> Dict[str, Dict[str, Any]]:
+    """{kind: counts, throughput and run-time percentiles} across every worker."""
+    summary = {}
+    result = await db.execute(QUEUE_SUMMARY_SQL, {"window": QUEUE_STATUS_WINDOW_SECONDS})
+    for row in result.mappings().all():
+        per_minute = row["succeeded"] * 60 / QUEUE_STATUS_WINDOW_SECONDS
+        summary[row["kind"]] = {
+            "queued": row["queued"],
+            "retrying": row["retrying"],
+            "running": row["running"],
+            "oldest_queued_seconds": _round(row["oldest_queued_seconds"], 1),
+            "succeeded": row["succeeded"],
+            "failed": row["failed"],
+            "per_minute": round(per_minute, 2),
+            # How long the current backlog takes at the recent completion rate; None when nothing completed
+            "drain_seconds": round(row["queued"] * 60 / per_minute, 1) if per_minute else None,
+            "run_p50": _round(row["run_p50"]),
+            "run_p95": _round(row["run_p95"]),
+            "queue_wait_p50": _round(row["queue_wait_p50"]),
+        }
+    return summary
+
+
+async def queue_status(db: AsyncSession) -> dict:
+    """Queue depth, in-flight work and recent latency for every stage (see module docstring)."""
+    jobs = await job_summary(db)
+    in_flight = in_flight_snapshot()
+    router = text_router.snapshot()
+    limiters = rate_limiter_stats()
+    return {
+        "window_seconds": QUEUE_STATUS_WINDOW_SECONDS,
+        "active_workers": (await db.execute(ACTIVE_WORKERS_SQL)).scalar_one(),
+        "jobs": jobs,
+        "stages": {
+            "text": {
+                "in_flight": in_flight.get("text_generation", {}),
+                "providers": {name: {"in_flight": in_flight.get("text_generation", {}).get(name, 0), **stats}
+                              for name, stats in router.items()},
+            },
+            "images": {
+                "queued": sum(limiter["waiting"] for limiter in limiters.values()),
+                "in_flight": sum(limiter["in_flight"] for limiter in limiters.values()),
+                "providers": limiters,
+            },
+            "uploads": {"in_flight": sum(in_flight.get("gcs_upload", {}).values())},
+        },
+        "latency": stage_snapshot(),
+    }
+
+
+def _remaining_seconds(job: dict, images_done: int, images_total: int,
+                       run_p50: Optional[float]) -> Tuple[Optional[float], str]:
+    """(seconds left, basis) for a running job: text then images from stage latencies, else the job-level p50."""
+    elapsed = job["running_seconds"] or 0.0
+    text_p50 = stage_percentile("text_generation")
+    images_p50 = stage_percentile("comic_images")
+    if images_total and images_p50 is not None:
+        # Renders run in parallel, so this is coarse, but it moves forward as each image lands
+        return images_p50 * (1 - images_done / images_total), "stage latency"
+    if job["kind"] == "generate_comic" and not images_total and text_p50 is not None and images_p50 is not None:
+        return max(text_p50 - elapsed, 0.0) + images_p50, "stage latency"
+    if run_p50 is not None:
+        return max(run_p50 - elapsed, 0.0), "run_p50"
+    return None, "no history"
+
+
+async def comic_eta(db: AsyncSession, comic: Comic) -> dict:
+    """Where a comic is in the pipeline and roughly how long until it completes."""
+    pages = await load_pages(db, comic)
+    eta = {"comic_id": comic.id, "status": comic.status, "pages": len(pages),
+           "images_total": len(pages), "images_done": sum(1 for page in pages if page.get("image_url"))}
+    if comic.status in ("completed", "failed"):
+        return {**eta, "stage": comic.status, "progress": 1.0, "eta_seconds": 0, "basis": "finished"}
+
+    job = (await db.execute(COMIC_JOB_SQL, {"comic_id": comic.id})).mappings().first()
+    if job is None:
+        # extend_comic writes the script before it queues the image job, so there is nothing to measure yet
+        return {**eta, "stage": "text", "progress": None, "eta_seconds": None, "basis": "no job"}
+
+    job = dict(job)
+    stats = (await job_summary(db)).get(job["kind"], {})
+    run_p50 = stats.get("run_p50") or stage_percentile("job")
+
+    # Images this job is responsible for: all pages for a new comic, the appended ones for an extension
+    if job["kind"] == "extend_comic":
+        start, count = job["payload"].get("start_idx", 0), job["payload"].get("num_pages", 0)
+        job_pages = pages[start:start + count]
+    else:
+        job_pages = pages
+    images_total = len(job_pages)
+    images_done = sum(1 for page in job_pages if page.get("image_url"))
+    eta.update(job_id=job["id"], kind=job["kind"], attempt=job["attempts"], max_attempts=job["max_attempts"],
+               images_total=images_total, images_done=images_done)
+
+    if job["status"] == "queued":
+        ahead = (await db.execute(JOBS_AHEAD_SQL, {"run_after": job["run_after"],
+                                                   "created_at": job["created_at"]})).scalar_one()
+        per_second = stats.get("per_minute", 0) / 60
+        if ahead == 0:
+            # Next in line: throughput reflects arrivals rather than capacity, so use the observed queue wait
+            wait, basis = stats.get("queue_wait_p50") or 0.0, "queue wait"
+        elif per_second:
+            wait, basis = ahead / per_second, "throughput"
+        elif run_p50 is not None:
+            # Nothing finished recently: assume the running jobs' slots free up one p50 at a time
+            wait, basis = math.ceil((ahead + 1) / max(stats.get("running", 0), 1)) * run_p50, "run_p50"
+        else:
+            return {**eta, "stage": "queued", "jobs_ahead": ahead, "progress": 0.0, "eta_seconds": None,
+                    "basis": "no history"}
+        wait = max(wait, job["retry_in_seconds"])
+        total = wait + (run_p50 or 0.0)
+        return {**eta, "stage": "queued", "jobs_ahead": ahead, "progress": 0.0,
+                "eta_seconds": round(total, 1), "basis": basis}
+
+    stage = "images" if images_total else "text"
+    remaining, basis = _remaining_seconds(job, images_done, images_total, run_p50)
+    elapsed = job["running_seconds"] or 0.0
+    if remaining is None:
+        progress = round(images_done / images_total, 2) if images_total else None
+        return {**eta, "stage": stage, "progress": progress, "eta_seconds": None, "basis": basis}
+    progress = elapsed / (elapsed + remaining) if elapsed + remaining > 0 else 0.0
+    return {**eta, "stage": stage, "progress": round(progress, 2), "eta_seconds": round(remaining, 1), "basis": basis}
@@ -0,0 +1,155 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Default (requests per minute, max concurrent requests) per provider/model.
+# Override with RATE_LIMITS="provider:model=rpm/concurrency;provider:model=rpm/concurrency"
+DEFAULT_LIMITS: Dict[Tuple[str, str], Tuple[float, int]] = {
+    ("gemini", "imagen-3.0-fast-generate-001"): (20, 4),
+    ("together", "black-forest-labs/FLUX.1-schnell"): (60, 5),
+    ("together", "black-forest-labs/FLUX.1-schnell-free"): (6, 2),
+}
+FALLBACK_LIMIT = (10, 2)
+
+
+def _parse_limits(spec: str) -> Dict[Tuple[str, str], Tuple[float, int]]:
+    limits = {}
+    for entry in filter(None, (part.strip() for part in spec.split(";"))):
+        try:
+            key, value = entry.split("=", 1)
+            provider, model = key.split(":", 1)
+            rpm, concurrency = value.split("/", 1)
+            limits[(provider.strip(), model.strip())] = (float(rpm), int(concurrency))
+        except ValueError:
+            logger.error(f"Ignoring malformed RATE_LIMITS entry: {entry!r}")
+    return limits
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """True for HTTP 429 / quota exhaustion errors from any of the image or text providers."""
+    for attr in ("code", "status_code", "status"):
+        if getattr(error, attr, None) == 429:
+            return True
+    message = str(error).lower()
+    return any(marker in message for marker in ("429", "resource_exhausted", "resource exhausted",
+                                                 "quota", "rate limit", "rate_limit", "too many requests"))
+
+
+class AdaptiveRateLimiter:
+    """Token bucket (requests per minute) plus a concurrency cap, adapted AIMD style.
+
+    Every success raises the allowed rate additively up to the configured maximum;
+    every 429/quota error halves it and pauses the bucket for a short cool-down.
+    """
+
+    def __init__(self, name: str, rpm: float, max_concurrency: int,
+                 min_rpm: float = 1.0, increase_step: float = 0.5,
+                 decrease_factor: float = 0.5, cooldown: float = 5.0):
+        self.name = name
+        self.max_rpm = rpm
+        self.min_rpm = min(min_rpm, rpm)
+        self.rpm = rpm
+        self.max_concurrency = max_concurrency
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+
+        self.capacity = max(1, max_concurrency)  # Burst size
+        self.tokens = float(self.capacity)
+        self.in_flight = 0
+        self.waiting = 0
+        self.throttled = 0
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rpm / 60)
+
+    async def _take_token(self):
+        async with self._lock:  # FIFO among waiters
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) * 60 / self.rpm)
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Waits for a concurrency slot and a token, then holds the slot for the duration of the call."""
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+            try:
+                await self._take_token()
+            except BaseException:
+                self._semaphore.release()
+                raise
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            yield self
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def record_success(self):
+        """Additive increase back towards the configured ceiling."""
+        if self.rpm < self.max_rpm:
+            self.rpm = min(self.max_rpm, self.rpm + self.increase_step)
+
+    def record_throttle(self):
+        """Multiplicative decrease after a 429/quota error."""
+        self.throttled += 1
+        self.rpm = max(self.min_rpm, self.rpm * self.decrease_factor)
+        self.tokens = 0
+        self._paused_until = time.monotonic() + self.cooldown
+        logger.warning(f"⚠️ Rate limited by {self.name}, reducing to {self.rpm:.1f} requests/min")
+
+    def record_error(self, error: Exception):
+        """Feeds a provider error back into the limiter (only rate-limit errors change the rate)."""
+        if is_rate_limit_error(error):
+            self.record_throttle()
+
+    def stats(self) -> dict:
+        return {
+            "rpm": round(self.rpm, 2),
+            "max_rpm": self.max_rpm,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "throttled": self.throttled,
+        }
+
+
+_limits = {**DEFAULT_LIMITS, **_parse_limits(os.getenv("RATE_LIMITS", ""))}
+_limiters: Dict[Tuple[str, str], AdaptiveRateLimiter] = {}
+
+
+def get_rate_limiter(provider: str, model: str) -> AdaptiveRateLimiter:
+    """Returns the process-wide limiter shared by every caller of this provider/model."""
+    key = (provider, model)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        rpm, concurrency = _limits.get(key, FALLBACK_LIMIT)
+        limiter = _limiters[key] = AdaptiveRateLimiter(f"{provider}:{model}", rpm, concurrency)
+    return limiter
+
+
+def rate_limiter_stats() -> Dict[str, dict]:
+    return {limiter.name: limiter.stats() for limiter in _limiters.values()}
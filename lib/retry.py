@@ -0,0 +1,105 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+
+from lib.metrics import counter
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RETRY_ATTEMPTS = int(os.getenv("DB_RETRY_ATTEMPTS", "5"))
+RETRY_BASE_DELAY = float(os.getenv("DB_RETRY_BASE_DELAY", "0.2"))    # Seconds, doubled per attempt before jitter
+RETRY_MAX_DELAY = float(os.getenv("DB_RETRY_MAX_DELAY", "5"))
+RETRY_DEADLINE = float(os.getenv("DB_RETRY_DEADLINE", "30"))         # Total seconds before giving up
+
+# Postgres SQLSTATEs worth another attempt: the transaction lost a race or the connection went away
+RETRYABLE_SQLSTATES = {
+    "40001": "serialization_failure",
+    "40P01": "deadlock_detected",
+    "55P03": "lock_not_available",
+    "53300": "too_many_connections",
+    "57P01": "admin_shutdown",
+    "57P02": "crash_shutdown",
+    "57P03": "cannot_connect_now",
+    "08000": "connection_exception",
+    "08001": "connection_exception",
+    "08003": "connection_exception",
+    "08004": "connection_exception",
+    "08006": "connection_failure",
+}
+
+retry_attempts = counter("retry_attempts_total", "Retries after a retryable error, by operation and reason")
+retry_exhausted = counter("retry_exhausted_total", "Operations that still failed after all retries")
+retry_fatal = counter("retry_fatal_errors_total", "Operations that failed with an error that is not retried")
+
+
+def _sqlstate(exc: BaseException) -> Optional[str]:
+    # asyncpg exposes `sqlstate` (also on SQLAlchemy's adapted errors), psycopg2 `pgcode`
+    return getattr(exc, "sqlstate", None) or getattr(exc, "pgcode", None)
+
+
+def classify_error(exc: BaseException) -> Optional[str]:
+    """Returns why `exc` is worth retrying, or None when it is fatal (bad SQL, constraint violation, bug...)."""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, DBAPIError):
+            if exc.connection_invalidated:
+                return "connection_invalidated"
+            reason = RETRYABLE_SQLSTATES.get(_sqlstate(exc.orig) or "")
+            if reason:
+                return reason
+        elif isinstance(exc, PoolTimeoutError):
+            return "pool_timeout"
+        elif isinstance(exc, (ConnectionResetError, BrokenPipeError, ConnectionAbortedError)):
+            return "connection_reset"
+        elif isinstance(exc, ConnectionRefusedError):
+            return "connection_refused"
+        elif isinstance(exc, (asyncio.TimeoutError, TimeoutError)):
+            return "timeout"
+        else:
+            reason = RETRYABLE_SQLSTATES.get(_sqlstate(exc) or "")
+            if reason:
+                return reason
+        exc = exc.__cause__ or exc.__context__
+    return None
+
+
+async def retry_async(fn: Callable[[], Awaitable[T]], operation: str,
+                      attempts: int = RETRY_ATTEMPTS, base_delay: float = RETRY_BASE_DELAY,
+                      max_delay: float = RETRY_MAX_DELAY, deadline: float = RETRY_DEADLINE,
+                      classify: Callable[[BaseException], Optional[str]] = classify_error) -> T:
+    """Awaits `fn()` until it succeeds, retrying errors that `classify` recognizes.
+
+    Delays use full jitter (uniform between 0 and the exponential backoff) so callers that failed
+    together don't retry together, and the whole thing gives up after `deadline` seconds.
+    `fn` must be safe to run again, e.g. a complete transaction in a fresh session.
+    """
+    start = time.monotonic()
+    for attempt in range(attempts):
+        try:
+            return await fn()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            reason = classify(e)
+            if reason is None:
+                retry_fatal.inc(operation=operation)
+                raise
+
+            delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+            if attempt == attempts - 1 or time.monotonic() - start + delay > deadline:
+                retry_exhausted.inc(operation=operation, reason=reason)
+                logger.error(f"❌ {operation} failed after {attempt + 1} attempts ({reason}): {e}")
+                raise
+
+            retry_attempts.inc(operation=operation, reason=reason)
+            logger.warning(f"{operation} failed ({reason}, attempt {attempt + 1}/{attempts}), "
+                           f"retrying in {delay:.2f}s: {e}")
+            await asyncio.sleep(delay)
@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import copy
+import hashlib
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Sequence, Tuple
+
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import select
+
+from database import async_session
+from models import ScriptCacheEntry
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_CACHE_SIZE = int(os.getenv("SCRIPT_CACHE_SIZE", "512"))                    # Entries kept in the in-memory LRU
+SCRIPT_CACHE_TTL_SECONDS = int(os.getenv("SCRIPT_CACHE_TTL_SECONDS", "86400"))    # 0 disables the cache
+SCRIPT_CACHE_PRUNE_SECONDS = 3600  # How often a process deletes expired rows
+
+
+def normalize_story_prompt(prompt: str) -> str:
+    """Whitespace, case and trailing punctuation don't change the story that gets written."""
+    return " ".join(prompt.split()).casefold().rstrip(" .!?…")
+
+
+def prompt_version(system_prompt: str) -> str:
+    """Short hash of a system prompt, so editing lib/story.py retires old cache entries."""
+    return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:12]
+
+
+def script_cache_key(prompt: str, model: str, version: str) -> str:
+    payload = json.dumps({"prompt": normalize_story_prompt(prompt), "model": model, "prompt_version": version},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ScriptCache:
+    """Validated ComicScript dicts by script_cache_key: in-memory LRU in front of the script_cache table."""
+
+    def __init__(self, max_size: int = SCRIPT_CACHE_SIZE, ttl: int = SCRIPT_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lru: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self._last_prune = float("-inf")
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def _remember(self, key: str, script: dict, created_at: float):
+        self._lru[key] = (created_at, script)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+
+    def _lookup_local(self, key: str) -> Optional[dict]:
+        entry = self._lru.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry[0] > self.ttl:
+            del self._lru[key]
+            return None
+        self._lru.move_to_end(key)
+        return entry[1]
+
+    async def get(self, keys: Sequence[str]) -> Optional[Tuple[str, dict]]:
+        """Returns (key, script) for the first of `keys` with a live entry. The script is a copy."""
+        if not self.enabled or not keys:
+            return None
+        for key in keys:
+            script = self._lookup_local(key)
+            if script is not None:
+                self.hits += 1
+                return key, copy.deepcopy(script)
+
+        try:
+            cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.ttl)
+            async with async_session() as db:
+                result = await db.exec(select(ScriptCacheEntry).where(
+                    ScriptCacheEntry.key.in_(keys), ScriptCacheEntry.created_at > cutoff))
+                entries = {entry.key: entry for entry in result.all()}
+        except Exception as e:
+            logger.warning(f"Script cache lookup failed: {e}")
+            entries = {}
+
+        for key in keys:
+            entry = entries.get(key)
+            if entry:
+                self.hits += 1
+                self._remember(key, entry.script, entry.created_at.timestamp())
+                return key, copy.deepcopy(entry.script)
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, script: dict, model: str, version: str):
+        if not self.enabled:
+            return
+        self._remember(key, copy.deepcopy(script), time.time())
+        try:
+            async with async_session() as db:
+                stmt = insert(ScriptCacheEntry).values(key=key, model=model, prompt_version=version, script=script,
+                                                       created_at=datetime.now(timezone.utc))
+                await db.execute(stmt.on_conflict_do_update(
+                    index_elements=["key"], set_={"script": stmt.excluded.script, "created_at": stmt.excluded.created_at}))
+                if time.monotonic() - self._last_prune > SCRIPT_CACHE_PRUNE_SECONDS:
+                    self._last_prune = time.monotonic()
+                    cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.ttl)
+                    await db.execute(delete(ScriptCacheEntry).where(ScriptCacheEntry.created_at <= cutoff))
+                await db.commit()
+        except Exception as e:
+            logger.warning(f"Script cache write failed: {e}")
+
+    def stats(self) -> dict:
+        return {"size": len(self._lru), "max_size": self.max_size, "ttl": self.ttl,
+                "hits": self.hits, "misses": self.misses}
+
+
+script_cache = ScriptCache()
@@ -0,0 +1,78 @@
+"""Bounded story context for extend_comic.
+
+Instead of resending every previous page, a continuation gets the comic's rolling
+`story_summary` (pages [0, summarized_pages)) plus the pages after it verbatim.
+After each extension the pages that fell out of the last STORY_WINDOW_PAGES are
+folded into the summary, so the next call again sends one summary and K pages:
+
+    previous_story = await story_context(db, comic, pages)   # before generating
+    await refresh_story_summary(db, comic, pages)            # after the extension lands
+
+Summaries are written with a compare-and-set on summarized_pages, so concurrent
+or retried jobs never fold the same pages twice.
+"""
+import os
+import asyncio
+import logging
+from typing import List
+
+from sqlalchemy import text
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from database import run_transaction
+from lib.gen_text import format_story_pages, summarize_story
+from models import Comic
+
+logger = logging.getLogger(__name__)
+
+STORY_WINDOW_PAGES = int(os.getenv("STORY_WINDOW_PAGES", "3"))            # Most recent pages sent verbatim
+STORY_SUMMARY_MAX_WORDS = int(os.getenv("STORY_SUMMARY_MAX_WORDS", "300"))
+# Unsummarized pages tolerated before extend_comic folds them inline instead of waiting for the job
+STORY_MAX_VERBATIM_PAGES = int(os.getenv("STORY_MAX_VERBATIM_PAGES", str(STORY_WINDOW_PAGES * 3)))
+
+UPDATE_SUMMARY_SQL = text("""
+    UPDATE comic SET story_summary = :summary, summarized_pages = :summarized_pages
+    WHERE id = :comic_id AND summarized_pages = :previous
+""")
+
+
+async def refresh_story_summary(db: AsyncSession, comic: Comic, pages: List[dict]) -> bool:
+    """Folds every page before the verbatim window into the summary (in its own transaction); True if it changed."""
+    start = comic.summarized_pages or 0
+    end = len(pages) - STORY_WINDOW_PAGES
+    if end <= start:
+        return False
+
+    loop = asyncio.get_running_loop()
+    summary = await loop.run_in_executor(None, lambda: summarize_story(
+        comic.story_summary, pages[start:end], start, max_words=STORY_SUMMARY_MAX_WORDS))
+
+    async def update(session: AsyncSession) -> int:
+        result = await session.execute(UPDATE_SUMMARY_SQL, {
+            "comic_id": comic.id, "summary": summary, "summarized_pages": end, "previous": start})
+        return result.rowcount
+
+    if await run_transaction(update, "story_summary") == 0:
+        # Another job folded these pages first; use its summary
+        await db.refresh(comic, ["story_summary", "summarized_pages"])
+        return False
+
+    comic.story_summary, comic.summarized_pages = summary, end
+    logger.info(f"Story summary for comic {comic.id} now covers {end} pages ({len(summary.split())} words)")
+    return True
+
+
+async def story_context(db: AsyncSession, comic: Comic, pages: List[dict]) -> str:
+    """`previous_story` for generate_new_comic_pages: summary plus the pages it doesn't cover."""
+    if len(pages) - (comic.summarized_pages or 0) > STORY_MAX_VERBATIM_PAGES:
+        # Older comic, or the last extend job hasn't summarized yet: catch up now so the prompt stays bounded
+        try:
+            await refresh_story_summary(db, comic, pages)
+        except Exception as e:
+            logger.warning(f"Could not summarize comic {comic.id}, sending its pages verbatim: {e}")
+
+    start = min(comic.summarized_pages or 0, len(pages))
+    recent = format_story_pages(pages[start:], start)
+    if not comic.story_summary:
+        return recent
+    return f"Story so far (pages 1-{start}): {comic.story_summary}\n\n{recent}"
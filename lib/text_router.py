@@ -0,0 +1,234 @@
+"""Latency-aware routing of comic script generation across text providers.
+
+Each provider keeps a rolling window of latencies and outcomes. A request goes to
+the healthy provider with the lowest p50; if it hasn't answered by its p95, a
+hedged request is sent to the next provider and whichever returns a valid
+ComicScript first wins. Failures and invalid scripts fall through to the next
+provider, so one slow or broken provider no longer fails the comic.
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from lib.gen_text import (gemini_text_generation_async, openai_text_generation_async,
+                          groq_text_generation_async, deepseek_text_generation_async)
+from lib.metrics import counter, histogram
+from lib.prompts import PromptBudgetExceeded, prompts
+from lib.script_cache import prompt_version, script_cache_key
+from lib.tracing import span
+from models import ComicScript
+
+logger = logging.getLogger(__name__)
+
+# Providers in priority order; the order breaks ties until latencies are known
+TEXT_PROVIDERS = [name.strip() for name in os.getenv("TEXT_PROVIDERS", "gemini,openai,groq,deepseek").split(",")
+                  if name.strip()]
+ROUTER_WINDOW = int(os.getenv("TEXT_ROUTER_WINDOW", "50"))                        # Samples kept per provider
+ROUTER_MIN_SAMPLES = int(os.getenv("TEXT_ROUTER_MIN_SAMPLES", "5"))               # Before percentiles are trusted
+ROUTER_MAX_ERROR_RATE = float(os.getenv("TEXT_ROUTER_MAX_ERROR_RATE", "0.5"))
+ROUTER_MAX_CONSECUTIVE_FAILURES = int(os.getenv("TEXT_ROUTER_MAX_CONSECUTIVE_FAILURES", "3"))
+ROUTER_COOLDOWN_SECONDS = float(os.getenv("TEXT_ROUTER_COOLDOWN_SECONDS", "60"))  # Unhealthy providers sit out this long
+ROUTER_HEDGING = os.getenv("TEXT_ROUTER_HEDGING", "true").lower() == "true"
+ROUTER_HEDGE_DEFAULT_SECONDS = float(os.getenv("TEXT_ROUTER_HEDGE_DEFAULT_SECONDS", "20"))  # Until p95 is known
+ROUTER_TIMEOUT_SECONDS = float(os.getenv("TEXT_ROUTER_TIMEOUT_SECONDS", "120"))   # Per provider attempt
+
+TextProvider = Callable[[object], Awaitable[dict]]
+
+# name -> (generate function, environment variables that must be set for it to be used)
+PROVIDERS: Dict[str, tuple] = {
+    "gemini": (gemini_text_generation_async, ("GOOGLE_APPLICATION_CREDENTIALS_JSON",)),
+    "openai": (openai_text_generation_async, ("OPENAI_API_KEY",)),
+    "groq": (groq_text_generation_async, ("GROQ_API_KEY",)),
+    "deepseek": (deepseek_text_generation_async, ("DEEPSEEK_API_KEY",)),
+}
+
+# name -> (model, system prompt) used by the functions above; part of the script cache key
+PROVIDER_MODELS: Dict[str, tuple] = {
+    "gemini": (prompts.model("story"), prompts.system_prompt("story")),
+    "openai": ("gpt-4o", prompts.system_prompt("story_v4")),
+    "groq": ("llama-3.3-70b-versatile", prompts.system_prompt("story_v4")),
+    "deepseek": ("deepseek-chat", prompts.system_prompt("story_v4")),
+}
+
+text_seconds = histogram("text_generation_seconds", "Latency of a successful script generation, by provider")
+text_errors = counter("text_generation_errors_total", "Failed script generations, by provider and reason")
+text_hedges = counter("text_generation_hedges_total", "Hedged requests sent because a provider exceeded its p95")
+
+
+class TextGenerationError(Exception):
+    pass
+
+
+class ProviderStats:
+    """Rolling latency and outcome window for one provider."""
+
+    def __init__(self, window: int = ROUTER_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)  # True for success
+        self.consecutive_failures = 0
+        self.last_failure: Optional[float] = None
+
+    def record_success(self, latency: float):
+        self.latencies.append(latency)
+        self.outcomes.append(True)
+        self.consecutive_failures = 0
+
+    def record_failure(self):
+        self.outcomes.append(False)
+        self.consecutive_failures += 1
+        self.last_failure = time.monotonic()
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self.latencies) < ROUTER_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @property
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def healthy(self) -> bool:
+        if self.last_failure is None or time.monotonic() - self.last_failure > ROUTER_COOLDOWN_SECONDS:
+            return True  # Let it try again after the cooldown
+        if self.consecutive_failures >= ROUTER_MAX_CONSECUTIVE_FAILURES:
+            return False
+        return len(self.outcomes) < ROUTER_MIN_SAMPLES or self.error_rate < ROUTER_MAX_ERROR_RATE
+
+    def snapshot(self) -> dict:
+        return {
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "error_rate": round(self.error_rate, 3),
+            "samples": len(self.outcomes),
+            "healthy": self.healthy(),
+        }
+
+
+class TextRouter:
+    def __init__(self, providers: Dict[str, TextProvider], hedging: bool = ROUTER_HEDGING):
+        self.providers = providers
+        self.hedging = hedging
+        self.stats = {name: ProviderStats() for name in providers}
+
+    def candidates(self) -> List[str]:
+        """Healthy providers, fastest p50 first (unmeasured ones after measured ones, in priority order)."""
+        order = list(self.providers)
+        healthy = [name for name in order if self.stats[name].healthy()]
+        if not healthy:
+            # Everything is failing: try them all, longest since the last failure first
+            return sorted(order, key=lambda name: self.stats[name].last_failure or 0)
+        return sorted(healthy, key=lambda name: (self.stats[name].percentile(0.5) is None,
+                                                 self.stats[name].percentile(0.5) or 0,
+                                                 order.index(name)))
+
+    def is_healthy(self, name: str) -> bool:
+        return name in self.stats and self.stats[name].healthy()
+
+    def hedge_delay(self, name: str) -> float:
+        return self.stats[name].percentile(0.95) or ROUTER_HEDGE_DEFAULT_SECONDS
+
+    def cache_key(self, name: str, prompt: str) -> str:
+        return script_cache_key(prompt, *self.cache_entry(name))
+
+    def cache_keys(self, prompt: str) -> List[str]:
+        """Script cache keys for a prompt, in the order the providers would be tried."""
+        return [self.cache_key(name, prompt) for name in self.candidates()]
+
+    def cache_entry(self, name: str) -> tuple:
+        """(model, prompt version) recorded with a cached script from `name`."""
+        model, system_prompt = PROVIDER_MODELS.get(name, (name, ""))
+        return model, prompt_version(system_prompt)
+
+    async def _attempt(self, name: str, request) -> dict:
+        start = time.perf_counter()
+        try:
+            with span("text_generation", provider=name, model=PROVIDER_MODELS.get(name, (name,))[0]):
+                result = await asyncio.wait_for(self.providers[name](request), timeout=ROUTER_TIMEOUT_SECONDS)
+                script = ComicScript.model_validate(result).model_dump()
+        except asyncio.CancelledError:
+            raise  # Lost a hedge race; says nothing about the provider
+        except Exception as e:
+            reason = "budget" if isinstance(e, PromptBudgetExceeded) else \
+                "invalid" if isinstance(e, (ValidationError, ValueError)) else \
+                "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+            if reason != "budget":  # An oversized prompt says nothing about the provider's health
+                self.stats[name].record_failure()
+            text_errors.inc(provider=name, reason=reason)
+            logger.warning(f"Text provider {name} failed ({reason}) after {time.perf_counter() - start:.1f}s: {e}")
+            raise
+
+        elapsed = time.perf_counter() - start
+        self.stats[name].record_success(elapsed)
+        text_seconds.observe(elapsed, provider=name)
+        logger.info(f"✅ Comic script from {name} in {elapsed:.2f}s")
+        return script
+
+    async def generate(self, request) -> Tuple[str, dict]:
+        """Returns (provider, validated ComicScript dict) from the first provider that produces one."""
+        candidates = self.candidates()
+        if not candidates:
+            raise TextGenerationError("No text generation provider is configured")
+
+        pending: Dict[asyncio.Task, tuple] = {}  # task -> (provider, start time)
+        errors = []
+
+        def launch():
+            name = candidates.pop(0)
+            pending[asyncio.create_task(self._attempt(name, request))] = (name, time.monotonic())
+
+        launch()
+        try:
+            while pending:
+                timeout = None
+                if self.hedging and candidates and len(pending) == 1:
+                    name, started = next(iter(pending.values()))
+                    timeout = max(0.0, started + self.hedge_delay(name) - time.monotonic())
+
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    text_hedges.inc(provider=name)
+                    logger.info(f"Text provider {name} is past its p95, hedging with {candidates[0]}")
+                    launch()
+                    continue
+
+                for task in done:
+                    name, _ = pending.pop(task)
+                    try:
+                        return name, task.result()
+                    except Exception as e:
+                        errors.append((name, e))
+                if not pending and candidates:
+                    launch()  # Fall back to the next provider
+        finally:
+            for task in pending:
+                task.cancel()
+
+        message = "; ".join(f"{name}: {e}" for name, e in errors)
+        if errors and all(isinstance(e, PromptBudgetExceeded) for _, e in errors):
+            raise PromptBudgetExceeded(message)  # Same prompt, same result: callers must not retry it
+        raise TextGenerationError("All text providers failed: " + message)
+
+    def snapshot(self) -> dict:
+        return {name: stats.snapshot() for name, stats in self.stats.items()}
+
+
+def configured_providers() -> Dict[str, TextProvider]:
+    """Providers from TEXT_PROVIDERS whose credentials are present."""
+    providers = {}
+    for name in TEXT_PROVIDERS:
+        if name not in PROVIDERS:
+            logger.error(f"Unknown text provider in TEXT_PROVIDERS: {name}")
+            continue
+        generate, required_env = PROVIDERS[name]
+        if all(os.getenv(var) for var in required_env):
+            providers[name] = generate
+    return providers
+
+
+text_router = TextRouter(configured_providers())
@@ -0,0 +1,163 @@
+"""Per-stage spans for the comic pipeline.
+
+    with span("image_render", provider="gemini", model=GEMINI_IMAGE_MODEL):
+        image_bytes = await ...
+
+Every span observes `stage_duration_seconds{stage, result, provider, model, ...}`
+(exported at GET /metrics) and, when OpenTelemetry is installed, opens an OTel span
+`comic.<stage>` carrying all of its attributes plus the current comic id.
+
+Only the low-cardinality attributes in STAGE_LABELS become Prometheus labels;
+comic_id and the rest go on the OTel span. `set_comic(comic_id)` tags everything
+that follows in the current task, including tasks it creates, so image renders
+and uploads deep in lib/ are attributed without passing the id around.
+
+Spans also count themselves in `stage_in_flight` while they run and keep the last
+STAGE_WINDOW successful durations per stage/provider, which lib/queue_status.py
+reads for in-flight counts and ETAs.
+
+OpenTelemetry is optional: without the API package spans are metrics only. With it,
+`configure_tracing()` installs an OTLP exporter when OTEL_EXPORTER_OTLP_ENDPOINT is
+set and the SDK is installed; otherwise any provider configured elsewhere (e.g.
+`opentelemetry-instrument`) receives the spans.
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from lib.metrics import gauge, histogram
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # Optional dependency
+    otel_trace = None
+
+logger = logging.getLogger(__name__)
+
+OTEL_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "comicai-backend")
+STAGE_WINDOW = int(os.getenv("STAGE_WINDOW", "200"))  # Recent successful durations kept per stage/provider for ETAs
+
+# Attributes that are safe as Prometheus labels (bounded value sets)
+STAGE_LABELS = ("provider", "model", "operation", "bucket", "backend")
+
+stage_seconds = histogram("stage_duration_seconds", "Duration of each pipeline stage, by stage, result and provider/model")
+stage_in_flight = gauge("stage_in_flight", "Stages currently running in this process, by stage and provider/model")
+
+# (stage, provider) -> recent successful durations; provider is "" for stages without one
+_recent: Dict[Tuple[str, str], deque] = {}
+
+current_comic: ContextVar[Optional[str]] = ContextVar("current_comic", default=None)
+
+_tracer = otel_trace.get_tracer("comicai") if otel_trace else None
+
+
+def set_comic(comic_id: Optional[str]):
+    """Attributes the spans of the current task (and tasks it starts from now on) to `comic_id`."""
+    current_comic.set(comic_id)
+
+
+def _otel_attributes(attributes: dict) -> dict:
+    comic_id = attributes.get("comic_id") or current_comic.get()
+    values = {**attributes, "comic_id": comic_id}
+    return {key: value if isinstance(value, (str, bool, int, float)) else str(value)
+            for key, value in values.items() if value is not None}
+
+
+def _stage_labels(attributes: dict) -> dict:
+    return {key: attributes[key] for key in STAGE_LABELS if attributes.get(key) is not None}
+
+
+def record_stage(stage: str, seconds: float, result: str = "ok", **attributes):
+    """Records a duration measured elsewhere (e.g. time spent queued) as a stage."""
+    stage_seconds.observe(seconds, stage=stage, result=result, **_stage_labels(attributes))
+    if result == "ok":
+        key = (stage, str(attributes.get("provider") or ""))
+        window = _recent.get(key)
+        if window is None:
+            window = _recent[key] = deque(maxlen=STAGE_WINDOW)
+        window.append(seconds)
+
+
+def stage_percentile(stage: str, q: float = 0.5, provider: Optional[str] = None) -> Optional[float]:
+    """Percentile of recent successful durations of `stage` in this process (all providers unless given)."""
+    values = []
+    for (name, prov), window in list(_recent.items()):
+        if name == stage and (provider is None or prov == provider):
+            values.extend(list(window))  # Single C-level copy; spans in executor threads append concurrently
+    if not values:
+        return None
+    values.sort()
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def stage_snapshot() -> dict:
+    """{stage: {provider: {"p50", "p95", "samples"}}} from the recent windows."""
+    snapshot: Dict[str, dict] = {}
+    for (stage, provider), window in sorted(list(_recent.items())):
+        values = sorted(window)
+        snapshot.setdefault(stage, {})[provider or "all"] = {
+            "p50": round(values[int(0.5 * len(values))], 3),
+            "p95": round(values[min(len(values) - 1, int(0.95 * len(values)))], 3),
+            "samples": len(values),
+        }
+    return snapshot
+
+
+def in_flight_snapshot() -> dict:
+    """{stage: {provider: count}} for stages running right now in this process."""
+    snapshot: Dict[str, dict] = {}
+    with stage_in_flight._lock:
+        series = dict(stage_in_flight.values)
+    for key, count in sorted(series.items()):
+        if count:
+            labels = dict(key)
+            snapshot.setdefault(labels.pop("stage"), {})[labels.get("provider", "all")] = int(count)
+    return snapshot
+
+
+@contextmanager
+def span(stage: str, **attributes):
+    """Times the block as `stage`; the result label is "error" if it raises and "cancelled" if it is cancelled."""
+    otel_span = _tracer.start_as_current_span(f"comic.{stage}", attributes=_otel_attributes(attributes)) \
+        if _tracer else nullcontext()
+    labels = {"stage": stage, **({"provider": attributes["provider"]} if attributes.get("provider") else {})}
+    start = time.perf_counter()
+    result = "ok"
+    stage_in_flight.inc(**labels)
+    with otel_span as current:
+        try:
+            yield current
+        except asyncio.CancelledError:
+            result = "cancelled"
+            raise
+        except BaseException:
+            result = "error"
+            raise
+        finally:
+            stage_in_flight.dec(**labels)
+            record_stage(stage, time.perf_counter() - start, result, **attributes)
+
+
+def configure_tracing() -> bool:
+    """Exports spans over OTLP when OTEL_EXPORTER_OTLP_ENDPOINT is set and the SDK is installed."""
+    if otel_trace is None or not os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        return False
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    except ImportError as e:
+        logger.warning(f"OTEL_EXPORTER_OTLP_ENDPOINT is set but the OpenTelemetry SDK/exporter is missing: {e}")
+        return False
+
+    provider = TracerProvider(resource=Resource.create({"service.name": OTEL_SERVICE_NAME}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    otel_trace.set_tracer_provider(provider)
+    logger.info(f"✅ Exporting traces to {os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT')}")
+    return True
@@ -0,0 +1,150 @@
+"""Webhook outbox delivery.
+
+Generation code calls `enqueue_webhook(db, comic_id)` in the same transaction that
+marks the comic completed, so a notification is never lost or sent for a change
+that rolled back. `WebhookDispatcher` drains the webhook_outbox table on the event
+loop with a pooled httpx client; any number of dispatchers can run side by side
+(rows are leased with `FOR UPDATE SKIP LOCKED`).
+"""
+import os
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+import httpx
+from sqlalchemy import text
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from database import run_transaction
+from lib.metrics import counter, histogram
+from lib.tracing import span
+from models import WebhookOutbox
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_TIMEOUT_SECONDS", "10"))
+WEBHOOK_POLL_SECONDS = float(os.getenv("WEBHOOK_POLL_SECONDS", "2"))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "8"))
+WEBHOOK_RETRY_BASE_DELAY = int(os.getenv("WEBHOOK_RETRY_BASE_DELAY", "5"))     # Seconds, doubled per attempt
+WEBHOOK_RETRY_MAX_DELAY = int(os.getenv("WEBHOOK_RETRY_MAX_DELAY", "600"))
+WEBHOOK_LEASE_SECONDS = int(os.getenv("WEBHOOK_LEASE_SECONDS", "60"))          # Hold on claimed rows while sending
+WEBHOOK_CLAIM_LIMIT = int(os.getenv("WEBHOOK_CLAIM_LIMIT", "50"))
+# 1 keeps the original {"comic_id": ...} body; above 1, up to that many ids go in one {"comic_ids": [...]} POST
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", "1"))
+
+webhook_deliveries = counter("webhook_deliveries_total", "Webhook POSTs, by result")
+webhook_seconds = histogram("webhook_delivery_seconds", "Latency of a webhook POST")
+
+# Leases due rows by pushing next_attempt_at past the send window; a crashed dispatcher's rows come back after it
+CLAIM_WEBHOOKS_SQL = text("""
+    UPDATE webhook_outbox
+    SET next_attempt_at = now() + make_interval(secs => :lease)
+    WHERE id IN (
+        SELECT id FROM webhook_outbox
+        WHERE status = 'pending' AND next_attempt_at <= now()
+        ORDER BY next_attempt_at
+        FOR UPDATE SKIP LOCKED
+        LIMIT :limit
+    )
+    RETURNING id, comic_id, event, attempts
+""")
+
+MARK_SENT_SQL = text("""
+    UPDATE webhook_outbox SET status = 'sent', sent_at = now(), attempts = attempts + 1
+    WHERE id = ANY(:ids)
+""")
+
+MARK_RETRY_SQL = text("""
+    UPDATE webhook_outbox
+    SET attempts = attempts + 1,
+        last_error = :error,
+        status = CASE WHEN attempts + 1 >= :max_attempts THEN 'failed' ELSE 'pending' END,
+        next_attempt_at = now() + make_interval(secs => LEAST(:max_delay, :base_delay * power(2, attempts)))
+    WHERE id = ANY(:ids)
+""")
+
+
+def webhook_url() -> Optional[str]:
+    """The Next.js webhook for the current environment."""
+    environment = os.getenv("ENVIRONMENT", "dev")
+    if environment == "prod":
+        return os.getenv("WEBHOOK_URL_PROD")
+    return os.getenv("WEBHOOK_URL_DEV")
+
+
+def enqueue_webhook(db: AsyncSession, comic_id: str, event: str = "comic.completed"):
+    """Adds a delivery to the caller's transaction; nothing is queued when no webhook is configured."""
+    if webhook_url():
+        db.add(WebhookOutbox(comic_id=comic_id, event=event))
+
+
+class WebhookDispatcher:
+    """Delivers pending outbox rows until stopped."""
+
+    def __init__(self, url: str, batch_size: int = WEBHOOK_BATCH_SIZE):
+        self.url = url
+        self.batch_size = max(1, batch_size)
+        self._stopping = asyncio.Event()
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(WEBHOOK_TIMEOUT_SECONDS),
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=5),
+        )
+
+    def stop(self):
+        self._stopping.set()
+
+    async def run(self):
+        logger.info(f"Webhook dispatcher delivering to {self.url}")
+        try:
+            while not self._stopping.is_set():
+                try:
+                    delivered = await self.drain_once()
+                except Exception as e:
+                    logger.error(f"Error delivering webhooks: {e}")
+                    delivered = 0
+                if not delivered:
+                    try:
+                        await asyncio.wait_for(self._stopping.wait(), timeout=WEBHOOK_POLL_SECONDS)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            await self._client.aclose()
+
+    async def drain_once(self) -> int:
+        """Claims due rows, POSTs them and records the outcome. Returns the number of rows handled."""
+        async def claim(db: AsyncSession):
+            result = await db.execute(CLAIM_WEBHOOKS_SQL, {"lease": WEBHOOK_LEASE_SECONDS, "limit": WEBHOOK_CLAIM_LIMIT})
+            return [dict(row._mapping) for row in result]
+
+        rows = await run_transaction(claim, "webhooks.claim")
+        batches = [rows[i:i + self.batch_size] for i in range(0, len(rows), self.batch_size)]
+        await asyncio.gather(*(self._deliver(batch) for batch in batches))
+        return len(rows)
+
+    async def _deliver(self, batch: List[Dict]):
+        ids = [row["id"] for row in batch]
+        if self.batch_size == 1:
+            body = {"comic_id": batch[0]["comic_id"]}
+        else:
+            body = {"comic_ids": [row["comic_id"] for row in batch]}
+
+        start = asyncio.get_running_loop().time()
+        try:
+            with span("webhook_delivery", comic_id=batch[0]["comic_id"] if len(batch) == 1 else None,
+                      batch_size=len(batch), attempt=batch[0]["attempts"] + 1):
+                response = await self._client.post(self.url, json=body)
+                response.raise_for_status()
+        except httpx.HTTPError as e:
+            webhook_deliveries.inc(result="error")
+            logger.error(f"Error sending webhook for {[row['comic_id'] for row in batch]}: {e}")
+            await run_transaction(lambda db: db.execute(MARK_RETRY_SQL, {
+                "ids": ids, "error": str(e)[:500], "max_attempts": WEBHOOK_MAX_ATTEMPTS,
+                "base_delay": WEBHOOK_RETRY_BASE_DELAY, "max_delay": WEBHOOK_RETRY_MAX_DELAY,
+            }), "webhooks.mark_retry")
+            return
+        finally:
+            webhook_seconds.observe(asyncio.get_running_loop().time() - start)
+
+        webhook_deliveries.inc(result="sent")
+        logger.info(f"Webhook sent successfully to {self.url}")
+        await run_transaction(lambda db: db.execute(MARK_SENT_SQL, {"ids": ids}), "webhooks.mark_sent")
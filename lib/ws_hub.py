@@ -0,0 +1,84 @@
+import json
+import asyncio
+import logging
+from typing import Dict, Iterable, Set
+
+from fastapi import WebSocket
+
+from lib.tracing import span
+
+logger = logging.getLogger(__name__)
+
+WS_SEND_TIMEOUT = 5  # Seconds before a slow client is skipped for a message
+
+
+def comic_topic(comic_id: str) -> str:
+    return f"comic:{comic_id}"
+
+
+def feed_topic(visibility: str, user_id: str = None) -> str:
+    """Community comics go to the public feed, private ones to their owner's feed."""
+    if visibility == "community" or not user_id:
+        return "feed:community"
+    return f"feed:user:{user_id}"
+
+
+class ConnectionHub:
+    """Local WebSocket clients and the topics (comic:<id>, feed:community, feed:user:<id>) they follow.
+
+    A message is serialized once and only sent to sockets subscribed to one of its topics.
+    """
+
+    def __init__(self):
+        self.clients: Set[WebSocket] = set()
+        self.topics: Dict[str, Set[WebSocket]] = {}
+        self.subscriptions: Dict[WebSocket, Set[str]] = {}
+
+    def connect(self, websocket: WebSocket):
+        self.clients.add(websocket)
+        self.subscriptions[websocket] = set()
+
+    def disconnect(self, websocket: WebSocket):
+        self.clients.discard(websocket)
+        for topic in self.subscriptions.pop(websocket, set()):
+            self._remove(topic, websocket)
+
+    def subscribe(self, websocket: WebSocket, topic: str):
+        self.topics.setdefault(topic, set()).add(websocket)
+        self.subscriptions.setdefault(websocket, set()).add(topic)
+
+    def unsubscribe(self, websocket: WebSocket, topic: str):
+        self._remove(topic, websocket)
+        self.subscriptions.get(websocket, set()).discard(topic)
+
+    def _remove(self, topic: str, websocket: WebSocket):
+        sockets = self.topics.get(topic)
+        if sockets is not None:
+            sockets.discard(websocket)
+            if not sockets:
+                del self.topics[topic]
+
+    def has_subscribers(self, topics: Iterable[str]) -> bool:
+        return any(topic in self.topics for topic in topics)
+
+    async def publish(self, topics: Iterable[str], message: dict):
+        """Sends `message` once to every local socket subscribed to any of `topics`."""
+        recipients = set()
+        for topic in topics:
+            recipients |= self.topics.get(topic, set())
+        if not recipients:
+            return
+
+        with span("ws_fanout", event=message.get("type"), comic_id=message.get("comic_id"), recipients=len(recipients)):
+            payload = json.dumps(message, default=str)
+            await asyncio.gather(*(self._send(websocket, payload) for websocket in recipients))
+
+    async def _send(self, websocket: WebSocket, payload: str):
+        try:
+            await asyncio.wait_for(websocket.send_text(payload), timeout=WS_SEND_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Error sending WebSocket message: {e}")
+            # Failed clients will be removed when they disconnect
+
+
+hub = ConnectionHub()
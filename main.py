@@ -1,24 +1,45 @@
 import os
+import json
 import logging
 import uuid
 import time
 import asyncio
-import requests
-from sqlalchemy import desc, text
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from sqlalchemy import text
 from typing import List, Dict, Any, Optional
 
-from fastapi import Depends, FastAPI, HTTPException, BackgroundTasks, Request, WebSocket, WebSocketDisconnect, Header
+from fastapi import Depends, FastAPI, HTTPException, BackgroundTasks, Request, Response, Query, WebSocket, WebSocketDisconnect, Header
 from fastapi.middleware.cors import CORSMiddleware
-from sqlmodel import select, Session
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from dotenv import load_dotenv
 
-from database import get_session, init_db, commit_with_retry
-from models import Comic, ComicRequest, ComicResponse
+from database import get_async_session, async_session, init_db, run_transaction
+from models import Comic, ComicRequest, ComicResponse, ComicCard, ComicPage, ComicScript
 from lib.gen_image import (generate_image_flux_async, generate_image_flux_free_async,
                           generate_and_upload_async, generate_image_gemini,
                           upload_image_gg_storage_async)
-from lib.gen_text import groq_text_generation, deepseek_text_generation, openai_text_generation, gemini_text_generation, generate_new_comic_pages
+from lib.gen_text import (groq_text_generation, deepseek_text_generation, openai_text_generation,
+                          gemini_text_generation, gemini_text_generation_stream, generate_new_comic_pages)
 from lib.init_gemini import init_vertexai
+from lib.job_queue import JobWorker, PermanentJobError, enqueue_job, get_queue_counts
+from lib.json_stream import ComicScriptStreamParser
+from lib.text_router import text_router
+from lib.script_cache import script_cache
+from lib.story_context import story_context, refresh_story_summary
+from lib.metrics import PROMETHEUS_CONTENT_TYPE, gauge, render_prometheus
+from lib.prompts import PromptBudgetExceeded, prompts
+from lib.queue_status import comic_eta, queue_status
+from lib.tracing import configure_tracing, set_comic, span
+from lib.characters import characters_from_pages, merge_characters, normalize_characters
+from lib.ws_hub import hub, comic_topic, feed_topic
+from lib.pubsub import pubsub
+from lib.webhooks import WebhookDispatcher, enqueue_webhook, webhook_url
+from lib.feed_cache import community_feed_cache, etag_matches
+from lib.pagination import NEXT_CURSOR_HEADER, cursor_param, paginate_newest_first, next_cursor
+from lib.page_store import (PAGE_STORAGE_MODE, COVER_IMAGE_URL, load_pages, load_pages_many, replace_pages, append_pages,
+                            update_image_urls, touch_comic)
 
 # Load environment variables
 load_dotenv()
@@ -26,11 +47,18 @@ load_dotenv()
 # Initialize FastAPI App
 app = FastAPI()
 
-# Store active generation tasks
-active_tasks = set()
+# Jobs run by workers pulling from the generation_job table. The API process runs an
+# embedded worker by default; set EMBEDDED_WORKER_CONCURRENCY=0 when running `python worker.py` separately.
+EMBEDDED_WORKER_CONCURRENCY = int(os.getenv("EMBEDDED_WORKER_CONCURRENCY", "2"))
+WORKER_SHUTDOWN_SECONDS = float(os.getenv("WORKER_SHUTDOWN_SECONDS", "60"))  # Grace period for running jobs on shutdown
+embedded_worker: Optional[JobWorker] = None
 
-# Store WebSocket connections
-connected_clients: List[WebSocket] = []
+# Webhook outbox delivery runs in every API process while a webhook URL is configured
+WEBHOOK_DISPATCHER_ENABLED = os.getenv("WEBHOOK_DISPATCHER", "true").lower() == "true"
+webhook_dispatcher: Optional[WebhookDispatcher] = None
+
+# Stream the script from Gemini and start rendering each page's image as soon as it is parsed
+STREAM_TEXT_GENERATION = os.getenv("STREAM_TEXT_GENERATION", "true").lower() == "true"
 
 app.add_middleware(
     CORSMiddleware,
@@ -39,6 +67,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 # Configure logging
@@ -48,38 +77,71 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Dependency Injection for Database Session
-def get_db():
-    session = next(get_session())
-    try:
+# Dependency Injection for Database Session (async, so handlers never block the event loop on DB I/O)
+async def get_db():
+    async for session in get_async_session():
         yield session
-    finally:
-        session.close()
 
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
+    global embedded_worker, webhook_dispatcher
     init_db()
     init_vertexai()
+    configure_tracing()
+    app.state.prompt_cache_task = asyncio.create_task(prompts.run_cache_refresher())  # Off the request path
     logger.info("Application started, database initialized")
 
-# WebSocket endpoint for real-time updates
+    # Relay comic events from every process (API or worker) to this process's sockets
+    await pubsub.start(relay_comic_event)
+
+    url = webhook_url()
+    if not url:
+        logger.error("Webhook URL not configured for the current environment.")
+    elif WEBHOOK_DISPATCHER_ENABLED:
+        webhook_dispatcher = WebhookDispatcher(url)
+        app.state.webhook_task = asyncio.create_task(webhook_dispatcher.run())
+
+    if EMBEDDED_WORKER_CONCURRENCY > 0:
+        embedded_worker = JobWorker(JOB_HANDLERS, concurrency=EMBEDDED_WORKER_CONCURRENCY,
+                                    on_failure=mark_comic_failed)
+        app.state.worker_task = asyncio.create_task(embedded_worker.run())
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    if embedded_worker:
+        embedded_worker.stop()
+        try:
+            await asyncio.wait_for(app.state.worker_task, WORKER_SHUTDOWN_SECONDS)
+        except asyncio.TimeoutError:
+            # wait_for cancelled the jobs; their leases expire and another worker reclaims them
+            logger.warning(f"Jobs still running after {WORKER_SHUTDOWN_SECONDS}s; cancelled them for retry")
+    if webhook_dispatcher:
+        webhook_dispatcher.stop()
+        await app.state.webhook_task
+    app.state.prompt_cache_task.cancel()
+    await pubsub.stop()
+
+# WebSocket endpoint for real-time updates.
+# Clients pick what they follow and then only receive deltas for it:
+#   {"action": "subscribe", "comic_id": "..."}             -> comic snapshot, then page/status deltas
+#   {"action": "subscribe", "feed": "community"}           -> new community comics and their status changes
+#   {"action": "subscribe", "feed": "user", "user_id": ".."} -> the same for one user's comics
+#   {"action": "unsubscribe", ...}                         -> same shapes
 @app.websocket("/api/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    
-    
     try:
         await websocket.accept()
         print(f"Incoming WebSocket connection request from {websocket.client}")
         await websocket.send_json({"message": "Hello from FastAPI WebSocket!"})
-        connected_clients.append(websocket)
-        logger.info(f"WebSocket client connected. Total clients: {len(connected_clients)}")
+        hub.connect(websocket)
+        logger.info(f"WebSocket client connected. Total clients: {len(hub.clients)}")
         
-        # Keep connection alive
+        # Keep connection alive and handle subscription requests
         while True:
             try:
-                # Wait for messages (will keep connection open)
                 data = await websocket.receive_text()
                 logger.debug(f"Received message from WebSocket client: {data}")
+                await handle_websocket_message(websocket, data)
             except WebSocketDisconnect:
                 logger.info("WebSocket client disconnected normally")
                 break
@@ -90,50 +152,79 @@ async def websocket_endpoint(websocket: WebSocket):
     except Exception as e:
         logger.error(f"Error accepting WebSocket connection: {str(e)}")
     finally:
-        # Remove client on disconnection
-        if websocket in connected_clients:
-            connected_clients.remove(websocket)
-        logger.info(f"WebSocket client removed. Remaining clients: {len(connected_clients)}")
-
-# Broadcast a message to all connected WebSocket clients
-async def broadcast_comic_update(comic_id: str, db: Session):
-    """Broadcast comic updates to all connected WebSocket clients."""
-    if not connected_clients:
+        # Remove client and its subscriptions on disconnection
+        hub.disconnect(websocket)
+        logger.info(f"WebSocket client removed. Remaining clients: {len(hub.clients)}")
+
+async def handle_websocket_message(websocket: WebSocket, data: str):
+    """Applies a subscribe/unsubscribe request from a client; other messages are ignored."""
+    try:
+        message = json.loads(data)
+    except ValueError:
         return
-    
-    # Fetch the latest comic data
-    comic = db.get(Comic, comic_id)
-    if not comic:
-        logger.error(f"Cannot broadcast update for comic {comic_id} - not found")
+    if not isinstance(message, dict) or message.get("action") not in ("subscribe", "unsubscribe"):
+        return
+
+    if message.get("comic_id"):
+        topic = comic_topic(message["comic_id"])
+    elif message.get("feed") == "community":
+        topic = feed_topic("community")
+    elif message.get("feed") == "user" and message.get("user_id"):
+        topic = feed_topic("private", message["user_id"])
+    else:
+        await websocket.send_json({"type": "error", "detail": "Unknown subscription"})
+        return
+
+    if message["action"] == "unsubscribe":
+        hub.unsubscribe(websocket, topic)
         return
-    
-    # Prepare the message
-    message = {
-        "type": "comic_update",
-        "comic": {
-            "id": comic.id,
-            "prompt": comic.prompt,
-            "title": comic.title,
-            "summary": comic.summary,
-            "pages": comic.pages,
-            "created_at": comic.created_at.isoformat() if comic.created_at else None,
-            "status": comic.status
-        }
-    }
-    
-    # Send to all connected clients
-    for client in connected_clients.copy():  # Use a copy to avoid modification during iteration
-        try:
-            await client.send_json(message)
-        except Exception as e:
-            logger.error(f"Error sending WebSocket message: {e}")
-            # Failed clients will be removed when they disconnect
+
+    hub.subscribe(websocket, topic)
+    if message.get("comic_id"):
+        # Send the current state once; everything after is a delta
+        async with async_session() as db:
+            comic = await db.get(Comic, message["comic_id"])
+            if comic:
+                await websocket.send_json({"type": "comic_snapshot", "comic": {
+                    "id": comic.id,
+                    "prompt": comic.prompt,
+                    "title": comic.title,
+                    "summary": comic.summary,
+                    "pages": await load_pages(db, comic),
+                    "created_at": comic.created_at.isoformat() if comic.created_at else None,
+                    "status": comic.status,
+                    "version": comic.version,
+                }})
+
+async def relay_comic_event(topics: List[str], message: dict):
+    """Handles an event from the pub/sub backbone: refreshes local caches, then notifies local sockets."""
+    if feed_topic("community") in topics:
+        community_feed_cache.invalidate()
+    await hub.publish(topics, message)
+
+# Publish a delta to the clients following a comic (and its feed), whichever API process they are connected to
+async def publish_comic_event(comic: Comic, event: dict, to_feed: bool = False):
+    """Sends `event` to subscribers of the comic, and to subscribers of its feed when `to_feed` is set."""
+    topics = [comic_topic(comic.id)]
+    if to_feed:
+        topics.append(feed_topic(comic.visibility, comic.user_id))
+    await pubsub.publish(topics, {"comic_id": comic.id, **event})
+
+async def publish_comic_status(comic: Comic, status: str):
+    await publish_comic_event(comic, {"type": "comic_status", "status": status}, to_feed=True)
 
 async def generate_comic_text(request: ComicRequest):
     """Generate comic text, isolated to make it easier to run in thread pool."""
     return gemini_text_generation(request)
 
+# Status changes bump version/updated_at like every other comic write
+COMPLETE_COMIC_SQL = "UPDATE comic SET status = 'completed', version = version + 1, updated_at = now() WHERE id = :comic_id"
+FAIL_COMIC_SQL = "UPDATE comic SET status = 'failed', version = version + 1, updated_at = now() WHERE id = :comic_id"
+
 PLACEHOLDER_ERROR_IMAGE = "/images/placeholder-error.png"  # Local path to avoid Next.js domain issues
+IMAGE_BUCKET = "bucket_comic"
+IMAGE_PREFIX = "gemini_image_"
+IMAGE_URL_FLUSH_SECONDS = float(os.getenv("IMAGE_URL_FLUSH_SECONDS", "2"))  # Batch window for image URL writes
 
 # async def generate_comic_images(comic_list):
 #     """Generate and upload images for comic pages (Gemini) ensuring all uploads complete before broadcasting."""
@@ -163,12 +254,9 @@ PLACEHOLDER_ERROR_IMAGE = "/images/placeholder-error.png"  # Local path to avoid
 
 async def generate_comic_images(comic_list):
     """Generate and upload images for comic pages (Gemini) and return only the image URLs."""
-    bucket_name = "bucket_comic"
-    prefix = "gemini_image_"
-
     # Create async tasks for all image generation & uploads
     image_tasks = [
-        generate_and_upload_async(page["image_prompt"], prefix, bucket_name)
+        generate_and_upload_async(page["image_prompt"], IMAGE_PREFIX, IMAGE_BUCKET)
         for page in comic_list['pages']
     ]
 
@@ -227,118 +315,241 @@ async def generate_comic_images_flux(comic_list):
     
     return comic_list
 
-async def process_comic_generation(request: ComicRequest, db: Session, comic_id: str):
+async def stream_comic_script(request: ComicRequest, db: AsyncSession, comic: Comic, image_tasks: list):
+    """Streams the script from Gemini, persisting each page and starting its image as soon as it is parsed.
+
+    Image tasks are appended to `image_tasks` in page order. Returns the full comic script, validated as a
+    ComicScript; if the finished stream isn't one, the renders are cancelled and ValueError is raised.
+    """
+    comic_id = comic.id
+    parser = ComicScriptStreamParser()
+    pages = []
+
+    # Start from a clean slate (a retried job may have stored some pages already)
+    await run_transaction(lambda session: replace_pages(session, comic, []), "stream_reset_pages")
+
+    async for chunk in gemini_text_generation_stream(request):
+        for page in parser.feed(chunk):
+            page = ComicPage.model_validate(page).model_dump()
+            image_tasks.append(asyncio.create_task(
+                generate_and_upload_async(page["image_prompt"], IMAGE_PREFIX, IMAGE_BUCKET)
+            ))
+            pages.append(page)
+            logger.info(f"📄 Page {len(pages)} of {comic_id} parsed, image rendering started")
+
+            await run_transaction(lambda session: append_pages(session, comic, [page], start_idx=len(pages) - 1),
+                                  "stream_append_page")
+            await publish_comic_event(comic, {"type": "pages_added", "start_index": len(pages) - 1, "pages": [page]})
+
+    try:
+        comic_list = ComicScript.model_validate(parser.result()).model_dump()
+    except ValueError as e:  # Truncated JSON, or a document missing title/summary/characters (ValidationError)
+        await cancel_image_tasks(image_tasks)  # Nothing will store these renders
+        raise ValueError(f"Streamed script for {comic_id} is incomplete or invalid: {e}") from e
+    comic_list["pages"] = pages  # Validated copies, in the order they were stored
+    return comic_list
+
+async def store_image_urls(db: AsyncSession, comic: Comic, image_tasks: list, start_idx: int = 0):
+    """Writes image URLs as renders finish, batching everything completed within a flush window into one UPDATE.
+
+    Each flush is published as a `page_images` delta; the cover also goes to the comic's feed.
+    """
+    async def indexed(idx, task):
+        try:
+            return idx, await task
+        except Exception as e:
+            logger.error(f"Error generating image for page {idx}: {e}")
+            return idx, None
+
+    pending = {asyncio.ensure_future(indexed(start_idx + i, task)) for i, task in enumerate(image_tasks)}
+    completed: Dict[int, str] = {}
+    last_flush = time.monotonic()
+
+    while pending:
+        # Wait for the next render, but not past the end of the current flush window
+        timeout = max(0.0, last_flush + IMAGE_URL_FLUSH_SECONDS - time.monotonic()) if completed else None
+        done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        for future in done:
+            idx, image_url = future.result()
+            completed[idx] = image_url if isinstance(image_url, str) and image_url else PLACEHOLDER_ERROR_IMAGE
+
+        # ✅ One document rewrite per flush window instead of one per page
+        if completed and (not pending or time.monotonic() - last_flush >= IMAGE_URL_FLUSH_SECONDS):
+            version = await run_transaction(lambda session: update_image_urls(session, comic.id, completed),
+                                            "store_image_urls")
+            await publish_comic_event(comic, {"type": "page_images", "images": completed, "version": version})
+            if 0 in completed:
+                await publish_comic_event(comic, {"type": "comic_cover", "cover_image_url": completed[0]}, to_feed=True)
+            completed = {}
+            last_flush = time.monotonic()
+
+async def cancel_image_tasks(image_tasks: list):
+    """Cancels renders that are still running and waits until they have stopped."""
+    for task in image_tasks:
+        task.cancel()
+    await asyncio.gather(*image_tasks, return_exceptions=True)
+
+async def process_comic_generation(request: ComicRequest, db: AsyncSession, comic_id: str):
     """Process comic generation in stages, updating the database as we go."""
     logger.info(f"Starting comic generation for ID: {comic_id}")
     start_time = time.time()
+    image_tasks = []
     
     try:
-        # Step 1: Generate text
-        loop = asyncio.get_running_loop()
-        comic_list = await loop.run_in_executor(None, lambda: gemini_text_generation(request))
-        
-        # # Update the comic with text content but no images yet
-        # visibility = "private" if request.user_id else "community"
-        
-        comic = db.get(Comic, comic_id)
-        # ✅ Step 1.1: Store text in the database
-        comic = db.get(Comic, comic_id)
+        comic = await db.get(Comic, comic_id)
         if not comic:
             logger.error(f"Comic {comic_id} not found in database")
             return
+        await db.commit()  # End the read; every write below runs in its own retried transaction
+
+        # Step 1: Reuse a script generated for the same prompt, unless the user asked for a fresh story
+        comic_list = None
+        if not request.fresh:
+            cached = await script_cache.get(text_router.cache_keys(request.prompt))
+            if cached:
+                comic_list = cached[1]
+                logger.info(f"♻️ Script cache hit for {comic_id}")
+        from_cache = comic_list is not None
+
+        # Step 1.0: Generate text. When streaming, images start rendering as each page is parsed
+        streamed = False
+        if not from_cache and STREAM_TEXT_GENERATION and text_router.is_healthy("gemini"):
+            stream_start = time.perf_counter()
+            try:
+                with span("text_generation", provider="gemini", model=prompts.model("story"), operation="stream"):
+                    comic_list = await stream_comic_script(request, db, comic, image_tasks)
+                text_router.stats["gemini"].record_success(time.perf_counter() - stream_start)
+                streamed = True
+                await script_cache.put(text_router.cache_key("gemini", request.prompt), comic_list,
+                                       *text_router.cache_entry("gemini"))
+            except Exception as e:
+                if not isinstance(e, PromptBudgetExceeded):  # An oversized prompt says nothing about Gemini's health
+                    text_router.stats["gemini"].record_failure()
+                if image_tasks:
+                    raise
+                logger.warning(f"Streaming text generation failed before the first page, falling back: {e}")
+
+        if comic_list is None:
+            # ✅ Fastest healthy provider, hedged past its p95, validated against ComicScript
+            provider, comic_list = await text_router.generate(request)
+            await script_cache.put(text_router.cache_key(provider, request.prompt), comic_list,
+                                   *text_router.cache_entry(provider))
 
-        comic.title = comic_list["title"]
-        comic.summary = comic_list["summary"]
-        comic.pages = comic_list["pages"]  # ✅ Ensure text is stored before moving to images
-        comic.status = "processing"
-        db.add(comic)
-        commit_with_retry(db)  # ✅ Ensure Step 1 commits fully
+        # ✅ Step 1.1: Store text in the database
+        async def store_script(session: AsyncSession) -> Comic:
+            comic = await session.get(Comic, comic_id)
+            comic.title = comic_list["title"]
+            comic.summary = comic_list["summary"]
+            comic.characters = normalize_characters(comic_list.get("characters"))  # ✅ Reused by every extension
+            if not streamed:  # Streamed pages were stored as they arrived
+                await replace_pages(session, comic, comic_list["pages"])  # ✅ Ensure text is stored before moving to images
+            comic.status = "processing"
+            session.add(comic)
+            await touch_comic(session, comic_id)
+            return comic
+        comic = await run_transaction(store_script, "store_script")  # ✅ Ensure Step 1 commits fully
 
         logger.info(f"✅ Text generation completed for {comic_id}, proceeding to image generation")
 
-        # ✅ Broadcast update with text content before generating images
-        await broadcast_comic_update(comic_id, db)
+        # ✅ Publish text content before generating images
+        if not streamed:
+            await publish_comic_event(comic, {"type": "pages_added", "start_index": 0, "pages": comic_list["pages"]})
+        await publish_comic_event(comic, {"type": "comic_text", "title": comic.title, "summary": comic.summary},
+                                  to_feed=True)
 
         # ✅ Step 2: Generate images **only if pages exist**
-        if not comic.pages or len(comic.pages) == 0:
+        if not comic_list["pages"]:
             logger.error(f"❌ No pages found for {comic_id}, skipping image generation")
             return
         
-        
         text_time = time.time()
         logger.info(f"Text generation completed in {text_time - start_time:.2f} seconds")
         
-        # Step 2: Generate images (this runs concurrently for all images)
-        # comic_list = await generate_comic_images_flux(comic_list)
-        # comic_list = await generate_comic_images(comic_list)
-        image_urls = await generate_comic_images(comic_list)
+        # Step 2: Start images for any pages that are not rendering yet (all of them when not streaming)
+        for page in comic_list["pages"][len(image_tasks):]:
+            image_tasks.append(asyncio.create_task(
+                generate_and_upload_async(page["image_prompt"], IMAGE_PREFIX, IMAGE_BUCKET)
+            ))
         
-        # ✅ Efficiently update JSONB image URLs one by one
-        for idx, image_url in enumerate(image_urls):
-            sql = """
-            UPDATE comic 
-            SET pages = jsonb_set(pages, '{%s, image_url}', '"%s"')
-            WHERE id = :comic_id
-            """ % (idx, image_url)
-            db.execute(text(sql), {"comic_id": comic_id})
-
-            # ✅ Commit every 3 updates to avoid large transactions
-            if idx % 3 == 0 or idx == len(image_urls) - 1:
-                commit_with_retry(db)
-                await broadcast_comic_update(comic_id, db)
+        # ✅ Update JSONB image URLs as renders finish
+        with span("comic_images", images=len(image_tasks)):
+            await store_image_urls(db, comic, image_tasks)
 
         # ✅ Final update: Set comic status to "completed"
-        db.execute(text("UPDATE comic SET status = 'completed' WHERE id = :comic_id"),
-                   {"comic_id": comic_id})
-        commit_with_retry(db)
+        await run_transaction(lambda session: complete_comic(session, comic_id), "complete_comic")
 
-        await broadcast_comic_update(comic_id, db)
-        send_webhook(comic_id)
+        await publish_comic_status(comic, "completed")
 
         total_time = time.time() - start_time
         logger.info(f"Total comic generation time: {total_time:.2f} seconds")
 
     except Exception as e:
+        # Re-raise so the job queue can retry; the comic is marked failed once attempts run out
         logger.error(f"Error in comic generation: {e}", exc_info=True)
-        try:
-            db.execute(text("UPDATE comic SET status = 'failed' WHERE id = :comic_id"),
-                       {"comic_id": comic_id})
-            commit_with_retry(db)
-            await broadcast_comic_update(comic_id, db)
-        except Exception as db_error:
-            logger.error(f"Failed to update comic status: {db_error}")
+        raise
+    finally:
+        # Also on cancellation (lost lease, shutdown), so renders can't keep writing once another worker owns the job
+        await cancel_image_tasks(image_tasks)
+
+async def complete_comic(db: AsyncSession, comic_id: str):
+    """Marks the comic completed and queues its webhook in the same transaction. The caller commits."""
+    await db.execute(text(COMPLETE_COMIC_SQL), {"comic_id": comic_id})
+    enqueue_webhook(db, comic_id)  # ✅ Delivered by the outbox dispatcher once this commits
+
+async def mark_comic_failed(job: Dict[str, Any], db: AsyncSession):
+    """Marks the comic of a job that exhausted its retries as failed."""
+    comic_id = job["comic_id"]
+    try:
+        await run_transaction(lambda session: session.execute(text(FAIL_COMIC_SQL), {"comic_id": comic_id}),
+                              "mark_comic_failed")
+        comic = await db.get(Comic, comic_id)
+        if comic:
+            await publish_comic_status(comic, "failed")
+    except Exception as db_error:
+        logger.error(f"Failed to update comic status: {db_error}")
 
 @app.post("/generate-comic", response_model=ComicResponse)
-async def generate_comic(request: ComicRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+async def generate_comic(request: ComicRequest, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
     """Starts comic generation and immediately returns with a comic ID."""
+    try:
+        prompts.check_budget("story", request.prompt)  # ✅ Refuse oversized prompts before queueing a job for them
+    except PromptBudgetExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
     comic_id = str(uuid.uuid4())
     logger.info(f"New comic generation request received: {comic_id}")
     
     # Create placeholder comic immediately
-    new_comic = Comic(
-        id=comic_id,
-        prompt=request.prompt,
-        user_id=request.user_id,
-        visibility="private" if request.user_id else "community",
-        pages=[],
-        summary="Your comic is being created...",
-        title="Generating your comic...",
-        status="processing"
-    )
-    
-    db.add(new_comic)
-    commit_with_retry(db)
-    logger.info(f"Created placeholder comic: {comic_id}")
-    
-    # Broadcast new comic to all connected clients
-    await broadcast_comic_update(comic_id, db)
-    
-    # Start background task
-    task = asyncio.create_task(process_comic_generation(request, db, comic_id))
+    async def create_comic(session: AsyncSession) -> Comic:
+        comic = Comic(
+            id=comic_id,
+            prompt=request.prompt,
+            user_id=request.user_id,
+            visibility="private" if request.user_id else "community",
+            pages=[],
+            summary="Your comic is being created...",
+            title="Generating your comic...",
+            status="processing",
+            page_storage=PAGE_STORAGE_MODE,
+        )
+        session.add(comic)
+        # ✅ Queue the generation job in the same transaction, so a crash can't leave an orphaned placeholder
+        enqueue_job(session, "generate_comic", comic_id,
+                    {"prompt": request.prompt, "user_id": request.user_id, "fresh": request.fresh})
+        return comic
+
+    new_comic = await run_transaction(create_comic, "create_comic")
+    logger.info(f"Created placeholder comic and queued generation job: {comic_id}")
     
-    # Keep track of task to prevent garbage collection
-    active_tasks.add(task)
-    task.add_done_callback(lambda t: active_tasks.remove(t))
+    # Announce the new comic to its feed
+    await publish_comic_event(new_comic, {"type": "comic_created", "comic": {
+        "id": comic_id,
+        "prompt": new_comic.prompt,
+        "title": new_comic.title,
+        "summary": new_comic.summary,
+        "created_at": new_comic.created_at.isoformat() if new_comic.created_at else None,
+        "status": new_comic.status,
+    }}, to_feed=True)
     
     return ComicResponse(
         id=comic_id,
@@ -359,47 +570,55 @@ async def extend_comic(comic_id: str,
                        request_body: ExtendComicRequest,
                     #    request: Request, 
                     #    background_tasks: BackgroundTasks, 
-                       db: Session = Depends(get_db)):
+                       db: AsyncSession = Depends(get_db)):
     """Extends a comic by generating new pages and images asynchronously."""
     
     # data = await request.json()
     # prompt = data.get("prompt")
 
     prompt = request_body.prompt
+    set_comic(comic_id)
 
     if not prompt:
         raise HTTPException(status_code=400, detail="Missing prompt in request")
 
-    comic = db.get(Comic, comic_id)
+    comic = await db.get(Comic, comic_id)
     
     if not comic:
         raise HTTPException(status_code=404, detail="Comic not found")
 
     # Step 1: generating text for new pages
-    original_pages = comic.pages
-    new_pages = generate_new_comic_pages(original_pages, num_pages=3)
+    original_pages = await load_pages(db, comic)
+    previous_story = await story_context(db, comic, original_pages)  # Rolling summary + last pages, not every page
+    if comic.characters is None:
+        comic.characters = characters_from_pages(original_pages)  # Comic from before the registry: scan once, then store
+    characters = comic.characters
+    loop = asyncio.get_running_loop()
+    new_pages = await loop.run_in_executor(None, lambda: generate_new_comic_pages(
+        original_pages, num_pages=3, previous_story=previous_story, characters=characters))
     
     # Initialize new pages with empty image URLs
     new_pages = [{**new_page, 'image_url': ""} for new_page in new_pages]
     
-    # Step 2: Store new pages in database first
-    combined_pages = original_pages + new_pages    
-    comic.pages = combined_pages
-    comic.status = "processing"
-    db.add(comic)
-    commit_with_retry(db)
-    
-    # Broadcast the update
-    await broadcast_comic_update(comic_id, db)
-    
-    # ✅ Step 3: Generate images separately in background
-    task = asyncio.create_task(process_extended_pages(comic_id, len(original_pages), new_pages, db))
+    # Step 2: Store new pages in database first (a plain insert for row-stored comics)
+    combined_pages = original_pages + new_pages
+    async def store_extension(session: AsyncSession) -> Comic:
+        comic = await session.get(Comic, comic_id)
+        await append_pages(session, comic, new_pages, start_idx=len(original_pages))
+        comic.characters = merge_characters(characters, characters_from_pages(new_pages))  # Characters the new pages introduced
+        comic.status = "processing"
+        session.add(comic)
+        # ✅ Step 3: Queue image generation for the new pages in the same transaction
+        enqueue_job(session, "extend_comic", comic_id, {"start_idx": len(original_pages), "num_pages": len(new_pages)})
+        return comic
+
+    comic = await run_transaction(store_extension, "extend_comic")
     
-    # Keep track of task to prevent garbage collection
-    active_tasks.add(task)
-    task.add_done_callback(lambda t: active_tasks.remove(t))
+    # Publish the new pages and the status change
+    await publish_comic_event(comic, {"type": "pages_added", "start_index": len(original_pages), "pages": new_pages})
+    await publish_comic_status(comic, "processing")
     
-    logger.info(f"Started background task to extend comic {comic_id} with {len(new_pages)} new pages")
+    logger.info(f"Queued job to extend comic {comic_id} with {len(new_pages)} new pages")
     
     # Return the comic with the new pages (images will be generated in background)
     return ComicResponse(
@@ -407,86 +626,190 @@ async def extend_comic(comic_id: str,
         prompt=comic.prompt,
         title=comic.title,
         summary=comic.summary,
-        pages=comic.pages,  # No images yet, will be added asynchronously
+        pages=combined_pages,  # No images yet, will be added asynchronously
         created_at=comic.created_at.isoformat() if comic.created_at else None,
         status="processing"
     )
 
-async def process_extended_pages(comic_id: str,  start_idx: int, new_pages: list, db: Session):
+async def process_extended_pages(comic_id: str,  start_idx: int, new_pages: list, db: AsyncSession):
     """Process image generation for extended comic pages, ensuring GCS uploads are completed before broadcasting."""
     start_time = time.time()
     logger.info(f"Starting image generation for extended comic {comic_id} with {len(new_pages)} new pages")
+    image_tasks = []
 
     try:
-        comic = db.get(Comic, comic_id)
+        comic = await db.get(Comic, comic_id)
         if not comic:
             logger.error(f"Comic {comic_id} not found during extension processing")
             return
+        await db.commit()  # End the read; the image URL writes run in their own retried transactions
 
-        # ✅ Step 1: Generate images for new pages. Generate images for new pages and return full comic object
-        image_urls = await generate_comic_images({"pages": new_pages})
-        
-        # ✅ Step 2: Update only `image_url` fields in JSONB
-        # not using this because of not efficient
-        # updated_new_pages = updated_comic["pages"]  # ✅ Extract updated new pages
-
-        # ✅ Step 2: Update only `image_url` fields in JSONB
-        for idx, image_url in enumerate(image_urls):
-            sql = """
-            UPDATE comic 
-            SET pages = jsonb_set(pages, '{%s, image_url}', '"%s"')
-            WHERE id = :comic_id
-            """ % (start_idx + idx, image_url)
-            db.execute(text(sql), {"comic_id": comic_id})
-
-            # ✅ Commit updates every 3 pages
-            if idx % 3 == 0 or idx == len(image_urls) - 1:
-                commit_with_retry(db)
-                await broadcast_comic_update(comic_id, db)
+        # ✅ Step 1: Generate images for new pages
+        image_tasks = [
+            asyncio.create_task(generate_and_upload_async(page["image_prompt"], IMAGE_PREFIX, IMAGE_BUCKET))
+            for page in new_pages
+        ]
+
+        # ✅ Step 2: Update only `image_url` fields in JSONB, batched per flush window
+        with span("comic_images", images=len(image_tasks)):
+            await store_image_urls(db, comic, image_tasks, start_idx=start_idx)
 
         # ✅ Step 3: Final update to set status to "completed"
-        db.execute(text("UPDATE comic SET status = 'completed' WHERE id = :comic_id"),
-                   {"comic_id": comic_id})
-        commit_with_retry(db)
+        await run_transaction(lambda session: complete_comic(session, comic_id), "complete_comic")
 
-        await broadcast_comic_update(comic_id, db)
-        send_webhook(comic_id)
+        await publish_comic_status(comic, "completed")
 
         total_time = time.time() - start_time
         logger.info(f"Extended comic image generation completed in {total_time:.2f} seconds")
 
     except Exception as e:
+        # Re-raise so the job queue can retry; the comic is marked failed once attempts run out
         logger.error(f"Error in comic extension process: {e}", exc_info=True)
-        try:
-            db.execute(text("UPDATE comic SET status = 'failed' WHERE id = :comic_id"),
-                       {"comic_id": comic_id})
-            commit_with_retry(db)
-            await broadcast_comic_update(comic_id, db)
-        except Exception as db_error:
-            logger.error(f"Failed to update comic status after extension error: {db_error}")
+        raise
+    finally:
+        await cancel_image_tasks(image_tasks)  # See process_comic_generation
+
+async def run_generate_comic_job(job: Dict[str, Any], db: AsyncSession):
+    """Job handler: generate text and images for a new comic."""
+    request = ComicRequest(**job["payload"])
+    try:
+        await process_comic_generation(request, db, job["comic_id"])
+    except PromptBudgetExceeded as e:
+        raise PermanentJobError(str(e)) from e  # Every attempt would send the same oversized prompt
+
+async def run_extend_comic_job(job: Dict[str, Any], db: AsyncSession):
+    """Job handler: generate images for pages appended by extend_comic."""
+    comic_id = job["comic_id"]
+    comic = await db.get(Comic, comic_id)
+    if not comic:
+        logger.error(f"Comic {comic_id} not found for extend job {job['id']}")
+        return
+
+    start_idx = job["payload"]["start_idx"]
+    pages = await load_pages(db, comic)
+    new_pages = pages[start_idx:start_idx + job["payload"]["num_pages"]]
+    await process_extended_pages(comic_id, start_idx, new_pages, db)
+
+    # Fold pages that left the verbatim window into the summary so the next extend stays the same size
+    try:
+        await refresh_story_summary(db, comic, pages)
+    except Exception as e:
+        logger.warning(f"Story summary update failed for comic {comic_id}: {e}")
+
+# Job kinds understood by JobWorker (used by the embedded worker and worker.py)
+JOB_HANDLERS = {
+    "generate_comic": run_generate_comic_job,
+    "extend_comic": run_extend_comic_job,
+}
 
 # Existing route implementations...
 @app.get("/comic/{comic_id}", response_model=ComicResponse)
-def get_comic(comic_id: str, db: Session = Depends(get_db)):
-    """Retrieves a comic by ID."""
-    comic = db.get(Comic, comic_id)
+async def get_comic(comic_id: str, request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    """Retrieves a comic by ID.
+
+    Sends ETag (the comic version) and Last-Modified; a poll with a matching If-None-Match or
+    If-Modified-Since gets a 304 after a primary key lookup of those two columns.
+    """
+    current = (await db.exec(select(Comic.version, Comic.updated_at).where(Comic.id == comic_id))).first()
+    if not current:
+        raise HTTPException(status_code=404, detail="Comic not found")
+
+    headers = comic_validators(*current)
+    if not_modified(request, headers, current.updated_at):
+        return Response(status_code=304, headers=headers)
+
+    comic = await db.get(Comic, comic_id)
     if not comic:
         raise HTTPException(status_code=404, detail="Comic not found")
+    response.headers.update(comic_validators(comic.version, comic.updated_at))
 
     return ComicResponse(
         id=comic.id,
         prompt=comic.prompt,
-        pages=comic.pages,
+        pages=await load_pages(db, comic),
         summary=comic.summary,
         title=comic.title,
         created_at=comic.created_at.isoformat() if comic.created_at else None,
         status=comic.status
     )
     
-@app.get("/comics", response_model=List[ComicResponse])
+def comic_validators(version: int, updated_at: Optional[datetime]) -> Dict[str, str]:
+    headers = {"ETag": f'"v{version}"', "Cache-Control": "no-cache"}
+    if updated_at:
+        headers["Last-Modified"] = format_datetime(updated_at.astimezone(timezone.utc), usegmt=True)
+    return headers
+
+def not_modified(request: Request, headers: Dict[str, str], updated_at: Optional[datetime]) -> bool:
+    """Conditional GET check; If-None-Match takes precedence over If-Modified-Since (RFC 9110)."""
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match:
+        return etag_matches(if_none_match, headers["ETag"])
+    if_modified_since = request.headers.get("If-Modified-Since")
+    if if_modified_since and updated_at:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+            if since.tzinfo is None:  # "-0000" or no zone at all: HTTP dates are always UTC
+                since = since.replace(tzinfo=timezone.utc)
+            return updated_at.replace(microsecond=0) <= since
+        except (TypeError, ValueError):
+            return False
+    return False
+
+# Columns behind each ComicCard field. Cards select only these instead of whole rows
+CARD_COLUMNS = {
+    "id": Comic.id,
+    "prompt": Comic.prompt,
+    "title": Comic.title,
+    "summary": Comic.summary,
+    "cover_image_url": COVER_IMAGE_URL,
+    "created_at": Comic.created_at,
+    "status": Comic.status,
+    "version": Comic.version,
+}
+DEFAULT_CARD_FIELDS = ["id", "title", "summary", "cover_image_url", "created_at", "status"]
+
+def card_fields(fields: Optional[str] = None) -> List[str]:
+    """Parses the `fields=` selector (comma separated ComicCard fields, `pages` included)."""
+    if not fields:
+        return DEFAULT_CARD_FIELDS
+    selected = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in selected if name not in CARD_COLUMNS and name != "pages"]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return selected
+
+def card_query(fields: List[str]):
+    """Selects the card columns for `fields`, plus what pagination and page loading need."""
+    names = [name for name in fields if name in CARD_COLUMNS]
+    names += [name for name in ("id", "created_at") if name not in names]
+    columns = [CARD_COLUMNS[name] for name in names]
+    if "pages" in fields:
+        columns += [Comic.pages, Comic.page_storage]
+    return select(*columns)
+
+async def build_cards(db: AsyncSession, rows: list, fields: List[str]) -> List[ComicCard]:
+    pages = await load_pages_many(db, rows) if "pages" in fields else {}
+    cards = []
+    for row in rows:
+        values = {name: getattr(row, name) for name in fields if name in CARD_COLUMNS}
+        if "created_at" in values:
+            values["created_at"] = values["created_at"].isoformat() if values["created_at"] else None
+        if "pages" in fields:
+            values["pages"] = pages[row.id]
+        cards.append(ComicCard(**values))
+    return cards
+
+# List endpoints are newest first and keyset-paginated on (created_at, id): pass the
+# X-Next-Cursor response header back as `cursor` to get the next page (absent on the last page).
+# They return compact cards; `fields=id,title,cover_image_url,...` picks the card fields (`pages` adds full pages).
+@app.get("/comics", response_model=List[ComicCard], response_model_exclude_unset=True)
 async def get_user_comics(
     request: Request,  # ✅ Use Request to manually extract headers
-    db: Session = Depends(get_db),
+    response: Response,
+    cursor: Optional[tuple] = Depends(cursor_param),
+    limit: int = Query(100, ge=1, le=100),
+    fields: List[str] = Depends(card_fields),
+    db: AsyncSession = Depends(get_db),
 ):
     """Fetch comics only for the authenticated user."""
     try:
@@ -495,110 +818,89 @@ async def get_user_comics(
         if not user_id:
             raise HTTPException(status_code=401, detail="Unauthorized: Missing user ID")
 
-        # Query only comics that belong to the user
-        comics = (
-            db.query(Comic)
-            .filter(Comic.user_id == user_id)
-            .order_by(desc(Comic.created_at))
-            .limit(100)
-            .all()
-        )
+        # Query only comics that belong to the user (served by ix_comic_user_created)
+        result = await db.exec(paginate_newest_first(card_query(fields).where(Comic.user_id == user_id), cursor, limit))
+        rows, cursor_after = next_cursor(result.all(), limit)
+        if cursor_after:
+            response.headers[NEXT_CURSOR_HEADER] = cursor_after
 
-        return [
-            ComicResponse(
-                id=comic.id,
-                prompt=comic.prompt,
-                title=comic.title,
-                summary=comic.summary,
-                pages=comic.pages,
-                created_at=comic.created_at.isoformat() if comic.created_at else None,
-                status=comic.status,
-            )
-            for comic in comics
-        ]
+        return await build_cards(db, rows, fields)
     except Exception as e:
         logger.error(f"Error fetching comics: {e}", exc_info=True)
         return []
 
-@app.get("/comics-public", response_model=list[ComicResponse])
-async def get_all_comics_public(db: Session = Depends(get_db)):
-    """Fetch all comics from the database."""
-    try:
-        # Use a more efficient query
-        query = db.query(Comic).filter(Comic.visibility == "community").order_by(desc(Comic.created_at)).limit(30)
-        comics = query.all()
-        
-        return [
-            ComicResponse(
-                id=comic.id,
-                prompt=comic.prompt,
-                title=comic.title,
-                summary=comic.summary,
-                pages=comic.pages,
-                created_at=comic.created_at.isoformat() if comic.created_at else None,
-                status=comic.status,
-            )
-            for comic in comics
-        ]
-    except Exception as e:
-        logger.error(f"Error fetching comics: {e}", exc_info=True)
-        # Return empty list instead of failing
-        return []
-    
-def send_webhook(comic_id: str):
-    """Sends a webhook to Next.js based on the environment."""
-    environment = os.getenv("ENVIRONMENT", "dev")
-    if environment == "prod":
-        webhook_url = os.getenv("WEBHOOK_URL_PROD")
+@app.get("/comics-public", response_model=list[ComicCard], response_model_exclude_unset=True)
+async def get_all_comics_public(request: Request, cursor: Optional[tuple] = Depends(cursor_param),
+                                limit: int = Query(30, ge=1, le=100), fields: List[str] = Depends(card_fields),
+                                db: AsyncSession = Depends(get_db)):
+    """Fetch all comics from the database.
+
+    Rendered pages are cached in memory until the next community feed event (or FEED_CACHE_TTL_SECONDS),
+    and carry a strong ETag so unchanged feeds cost a 304.
+    """
+    cache_key = (request.query_params.get("cursor"), limit, tuple(fields))
+    cached = community_feed_cache.get(cache_key)
+    if cached is None:
+        generation = community_feed_cache.generation
+        try:
+            # Keyset page served by ix_comic_visibility_created
+            query = paginate_newest_first(card_query(fields).where(Comic.visibility == "community"), cursor, limit)
+            rows, cursor_after = next_cursor((await db.exec(query)).all(), limit)
+            cards = await build_cards(db, rows, fields)
+        except Exception as e:
+            logger.error(f"Error fetching comics: {e}", exc_info=True)
+            # Return empty list instead of failing
+            return []
+        body = json.dumps([card.model_dump(exclude_unset=True) for card in cards]).encode("utf-8")
+        etag = community_feed_cache.put(cache_key, body, cursor_after, generation)
     else:
-        webhook_url = os.getenv("WEBHOOK_URL_DEV")
-
-    if not webhook_url:
-        logger.error("Webhook URL not configured for the current environment.")
-        return
-
-    try:
-        response = requests.post(webhook_url, json={"comic_id": comic_id})
-        response.raise_for_status()
-        logger.info(f"Webhook sent successfully to {webhook_url}")
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error sending webhook: {e}")
-
+        body, etag, cursor_after = cached
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if cursor_after:
+        headers[NEXT_CURSOR_HEADER] = cursor_after
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+    
 @app.put("/comic/{comic_id}/reload-page/{page_index}", response_model=ComicResponse)
-async def reload_comic_page(comic_id: str, page_index: int, db: Session = Depends(get_db)):
-    """Re-generates the image for a specific page in the comic."""
+async def reload_comic_page(comic_id: str, page_index: int, reroll: bool = False, db: AsyncSession = Depends(get_db)):
+    """Re-generates the image for a specific page in the comic.
+
+    A previously rendered identical prompt is served from the image cache; pass `reroll=true` to force a new image.
+    """
     logger.info(f"Reloading image for comic {comic_id}, page {page_index}")
+    set_comic(comic_id)
 
-    comic = db.get(Comic, comic_id)
+    comic = await db.get(Comic, comic_id)
     
     if not comic:
         raise HTTPException(status_code=404, detail="Comic not found")
 
+    pages = await load_pages(db, comic)
+
     # Validate page index
-    if page_index < 0 or page_index >= len(comic.pages):
+    if page_index < 0 or page_index >= len(pages):
         raise HTTPException(status_code=400, detail="Invalid page index")
 
-    page = comic.pages[page_index]
+    page = pages[page_index]
 
     # ✅ Ensure the page has an image prompt to regenerate
     if "image_prompt" not in page or not page["image_prompt"]:
         raise HTTPException(status_code=400, detail="Page does not have an image prompt")
 
     # ✅ Regenerate only the failed/missing image
-    image_url = await generate_and_upload_async(page["image_prompt"])
-
-    # ✅ Update only the `image_url` field in the JSONB column
-    sql = """
-    UPDATE comic 
-    SET pages = jsonb_set(pages, '{%s, image_url}', '"%s"')
-    WHERE id = :comic_id
-    """ % (page_index, image_url)
+    image_url = await generate_and_upload_async(page["image_prompt"], use_cache=not reroll)
 
-    db.execute(text(sql), {"comic_id": comic_id})
-    commit_with_retry(db)
+    # ✅ Update only the `image_url` field of that page
+    version = await run_transaction(lambda session: update_image_urls(session, comic_id, {page_index: image_url}),
+                                    "reload_page")
+    pages[page_index] = {**page, "image_url": image_url}
 
-    # ✅ Broadcast the update
-    await broadcast_comic_update(comic_id, db)
+    # ✅ Publish the new image
+    await publish_comic_event(comic, {"type": "page_images", "images": {page_index: image_url}, "version": version})
+    if page_index == 0:
+        await publish_comic_event(comic, {"type": "comic_cover", "cover_image_url": image_url}, to_feed=True)
 
     logger.info(f"Reloaded image for comic {comic_id}, page {page_index}")
     
@@ -607,13 +909,45 @@ async def reload_comic_page(comic_id: str, page_index: int, db: Session = Depend
         prompt=comic.prompt,
         title=comic.title,
         summary=comic.summary,
-        pages=comic.pages,  # ✅ Updated with new image
+        pages=pages,  # ✅ Updated with new image
         created_at=comic.created_at.isoformat() if comic.created_at else None,
         status="completed"
     )
 
 
 @app.get("/image-queue-size")
-async def get_image_queue_size():
-    """Returns the current size of the active generation tasks."""
-    return {"active_tasks": len(active_tasks)}
\ No newline at end of file
+async def get_image_queue_size(db: AsyncSession = Depends(get_db)):
+    """Returns the number of unfinished generation jobs across all workers."""
+    counts = await get_queue_counts(db)
+    queued = sum(c["queued"] for c in counts.values())
+    running = sum(c["running"] for c in counts.values())
+    return {"active_tasks": queued + running, "queued": queued, "running": running, "by_kind": counts}
+
+@app.get("/queue/status")
+async def get_queue_status(db: AsyncSession = Depends(get_db)):
+    """Per-stage queue depth, in-flight work per provider, recent throughput and stage latencies."""
+    return await queue_status(db)
+
+@app.get("/comic/{comic_id}/eta")
+async def get_comic_eta(comic_id: str, db: AsyncSession = Depends(get_db)):
+    """Pipeline stage, progress (0-1) and estimated seconds until the comic completes."""
+    comic = await db.get(Comic, comic_id)
+    if not comic:
+        raise HTTPException(status_code=404, detail="Comic not found")
+    return await comic_eta(db, comic)
+
+websocket_clients = gauge("websocket_clients", "WebSocket connections open on this process")
+websocket_clients.set_function(lambda: len(hub.clients))
+generation_jobs = gauge("generation_jobs", "Unfinished generation jobs across all workers, by kind and status")
+
+@app.get("/metrics")
+async def metrics(db: AsyncSession = Depends(get_db)):
+    """Prometheus scrape endpoint: stage latencies, provider, cache, DB and webhook metrics."""
+    try:
+        generation_jobs.values.clear()  # Kinds with no unfinished jobs drop out instead of going stale
+        for kind, statuses in (await get_queue_counts(db)).items():
+            for status, n in statuses.items():
+                generation_jobs.set(n, kind=kind, status=status)
+    except Exception as e:
+        logger.warning(f"Could not read queue counts for /metrics: {e}")
+    return Response(content=render_prometheus(), media_type=PROMETHEUS_CONTENT_TYPE)
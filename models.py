@@ -1,4 +1,5 @@
 from sqlmodel import SQLModel, Field, Column, JSON
+from sqlalchemy import DateTime, Index, Text, func
 from sqlalchemy.dialects.postgresql import JSONB
 from datetime import datetime
 from uuid import uuid4
@@ -37,6 +38,7 @@ class ComicScript(BaseModel):
 class ComicRequest(SQLModel):
     prompt: str
     user_id: Optional[str] = None  # Clerk User ID (NULL for guests)
+    fresh: bool = False  # Skip the script cache and write a new story
 
 # ✅ Response Model for Returning a Comic
 class ComicResponse(SQLModel):
@@ -48,8 +50,26 @@ class ComicResponse(SQLModel):
     created_at: Optional[str]  # ISO format datetime
     status: str
 
+# ✅ Compact feed card returned by the list endpoints; only the requested `fields=` are set
+class ComicCard(SQLModel):
+    id: Optional[str] = None
+    prompt: Optional[str] = None
+    title: Optional[str] = None
+    summary: Optional[str] = None
+    cover_image_url: Optional[str] = None  # image_url of the first page
+    created_at: Optional[str] = None  # ISO format datetime
+    status: Optional[str] = None
+    version: Optional[int] = None
+    pages: Optional[List[dict]] = None  # Only when requested explicitly
+
 # ✅ Database Model for Comic
 class Comic(SQLModel, table=True):
+    # Newest-first keyset pagination for /comics and /comics-public (see lib/pagination.py)
+    __table_args__ = (
+        Index("ix_comic_user_created", "user_id", "created_at", "id"),
+        Index("ix_comic_visibility_created", "visibility", "created_at", "id"),
+    )
+
     id: str = Field(default_factory=lambda: str(uuid4()), primary_key=True)
     prompt: str
     title: str
@@ -60,5 +80,91 @@ class Comic(SQLModel, table=True):
     user_id: Optional[str] = Field(default=None)  # Clerk User ID (NULL for guests)
     visibility: str = Field(default="community")  # "community" or "private"
     status: str = Field(default="processing")
+    version: int = Field(default=0)  # Bumped by every write (see lib/page_store.py), used as the ETag
+    updated_at: Optional[datetime] = Field(default=None, sa_column=Column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False))  # Last-Modified
+    page_storage: str = Field(default="jsonb")  # "jsonb" (pages column) or "rows" (comic_page table), see lib/page_store.py
+    characters: Optional[List[dict]] = Field(default=None, sa_column=Column(JSONB))  # Character registry, see lib/characters.py
+    story_summary: Optional[str] = Field(default=None, sa_column=Column(Text))  # Rolling summary of pages [0, summarized_pages)
+    summarized_pages: int = Field(default=0)  # Pages folded into story_summary; later pages are sent verbatim (lib/story_context.py)
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)  # ✅ Allow Pydantic to handle unknown types
+
+# ✅ Database Model for one page of a comic stored in "rows" mode (see lib/page_store.py)
+class ComicPageRecord(SQLModel, table=True):
+    __tablename__ = "comic_page"
+
+    comic_id: str = Field(foreign_key="comic.id", primary_key=True, ondelete="CASCADE")
+    page_index: int = Field(primary_key=True)
+    page: dict = Field(sa_column=Column(JSONB, nullable=False))  # Page content without image_url
+    image_url: Optional[str] = Field(default=None)
+
+# ✅ Database Model for durable generation jobs (claimed by workers, see lib/job_queue.py)
+class GenerationJob(SQLModel, table=True):
+    __tablename__ = "generation_job"
+    __table_args__ = (
+        Index("ix_generation_job_claim", "status", "run_after"),
+        Index("ix_generation_job_updated", "updated_at"),  # Recent finished jobs for /queue/status
+    )
+
+    id: str = Field(default_factory=lambda: str(uuid4()), primary_key=True)
+    kind: str  # "generate_comic" or "extend_comic"
+    comic_id: str = Field(index=True)
+    payload: dict = Field(default_factory=dict, sa_column=Column(JSONB, nullable=False))
+    status: str = Field(default="queued")  # "queued", "running", "succeeded" or "failed"
+    attempts: int = Field(default=0)
+    max_attempts: int = Field(default=3)
+    locked_by: Optional[str] = Field(default=None)  # Worker id holding the lease
+    last_error: Optional[str] = Field(default=None)
+
+    # Timestamps are set by Postgres so every worker compares against the same clock
+    run_after: Optional[datetime] = Field(default=None, sa_column=Column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False))
+    lease_expires_at: Optional[datetime] = Field(default=None, sa_column=Column(DateTime(timezone=True)))
+    heartbeat_at: Optional[datetime] = Field(default=None, sa_column=Column(DateTime(timezone=True)))
+    started_at: Optional[datetime] = Field(default=None, sa_column=Column(DateTime(timezone=True)))  # Claim time of the current attempt
+    created_at: Optional[datetime] = Field(default=None, sa_column=Column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False))
+    updated_at: Optional[datetime] = Field(default=None, sa_column=Column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False))
+
+
+# ✅ Database Model for rendered images, keyed by a hash of prompt + model + render config (see lib/image_cache.py)
+class ImageCacheEntry(SQLModel, table=True):
+    __tablename__ = "image_cache"
+
+    key: str = Field(primary_key=True)  # sha256 hex digest
+    url: str
+    model: str
+    created_at: datetime = Field(default_factory=datetime.now)
+
+
+# ✅ Database Model for webhook deliveries, written in the same transaction as the status change (see lib/webhooks.py)
+class WebhookOutbox(SQLModel, table=True):
+    __tablename__ = "webhook_outbox"
+    __table_args__ = (Index("ix_webhook_outbox_due", "status", "next_attempt_at"),)
+
+    id: str = Field(default_factory=lambda: str(uuid4()), primary_key=True)
+    comic_id: str
+    event: str = Field(default="comic.completed")
+    status: str = Field(default="pending")  # "pending", "sent" or "failed"
+    attempts: int = Field(default=0)
+    last_error: Optional[str] = Field(default=None)
+
+    next_attempt_at: Optional[datetime] = Field(default=None, sa_column=Column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False))
+    created_at: Optional[datetime] = Field(default=None, sa_column=Column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False))
+    sent_at: Optional[datetime] = Field(default=None, sa_column=Column(DateTime(timezone=True)))
+
+
+# ✅ Database Model for generated scripts, keyed by a hash of normalized prompt + model + system prompt (see lib/script_cache.py)
+class ScriptCacheEntry(SQLModel, table=True):
+    __tablename__ = "script_cache"
 
-    model_config = ConfigDict(arbitrary_types_allowed=True)  # ✅ Allow Pydantic to handle unknown types
\ No newline at end of file
+    key: str = Field(primary_key=True)  # sha256 hex digest
+    model: str
+    prompt_version: str  # Hash of the system prompt the script was generated with
+    script: dict = Field(sa_column=Column(JSONB, nullable=False))  # Validated ComicScript
+    created_at: Optional[datetime] = Field(default=None, sa_column=Column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False, index=True))
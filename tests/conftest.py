@@ -0,0 +1,6 @@
+import os
+import sys
+
+# database.py refuses to import without DATABASE_URL; these tests never open a connection
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/comicai_test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
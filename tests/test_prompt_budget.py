@@ -0,0 +1,65 @@
+"""An oversized prompt fails its generation job once instead of using every attempt."""
+import asyncio
+
+import pytest
+
+from lib import job_queue
+from lib.job_queue import JobWorker, PermanentJobError
+from lib.prompts import PromptBudgetExceeded
+from lib.text_router import TextGenerationError, TextRouter
+
+
+def run_job(monkeypatch, handler):
+    """Runs one claimed job through JobWorker._run_job; returns the fail_job calls and failure callbacks."""
+    fail_calls, failures = [], []
+
+    async def with_session(fn, *args):
+        if fn is job_queue.fail_job:
+            job, worker_id, error, permanent = args
+            fail_calls.append(permanent)
+            return "failed" if permanent or job["attempts"] >= job["max_attempts"] else "queued"
+        return None
+
+    async def on_failure(job, db):
+        failures.append(job["id"])
+
+    monkeypatch.setattr(job_queue, "_with_session", with_session)
+    worker = JobWorker({"generate_comic": handler}, on_failure=on_failure)
+    job = {"id": "job-1", "kind": "generate_comic", "comic_id": "comic-1", "payload": {},
+           "attempts": 1, "max_attempts": 3}
+    asyncio.run(worker._run_job(job))
+    return fail_calls, failures
+
+
+def test_permanent_error_fails_job_on_first_attempt(monkeypatch):
+    async def handler(job, db):
+        raise PermanentJobError("Prompt story needs ~9000 input tokens, over the budget of 8000")
+
+    fail_calls, failures = run_job(monkeypatch, handler)
+    assert fail_calls == [True]
+    assert failures == ["job-1"]
+
+
+def test_other_errors_are_retried(monkeypatch):
+    async def handler(job, db):
+        raise RuntimeError("503 UNAVAILABLE")
+
+    fail_calls, failures = run_job(monkeypatch, handler)
+    assert fail_calls == [False]
+    assert failures == []
+
+
+def test_router_reports_budget_when_every_provider_refuses():
+    async def over_budget(request):
+        raise PromptBudgetExceeded("over budget")
+
+    async def broken(request):
+        raise RuntimeError("boom")
+
+    router = TextRouter({"gemini": over_budget, "openai": over_budget}, hedging=False)
+    with pytest.raises(PromptBudgetExceeded):
+        asyncio.run(router.generate(None))
+
+    mixed = TextRouter({"gemini": over_budget, "openai": broken}, hedging=False)
+    with pytest.raises(TextGenerationError):
+        asyncio.run(mixed.generate(None))
@@ -0,0 +1,52 @@
+"""Standalone comic generation worker.
+
+Runs jobs from the generation_job table so generation can scale separately from
+the API. Start as many processes as needed:
+
+    python worker.py --concurrency 4
+
+and set EMBEDDED_WORKER_CONCURRENCY=0 on the API instances.
+"""
+import os
+import signal
+import asyncio
+import logging
+import argparse
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from database import init_db
+from lib.init_gemini import init_vertexai
+from lib.job_queue import JobWorker
+from lib.prompts import prompts
+from main import JOB_HANDLERS, mark_comic_failed
+
+logger = logging.getLogger(__name__)
+
+
+async def main(concurrency: int):
+    init_db()
+    init_vertexai()
+
+    worker = JobWorker(JOB_HANDLERS, concurrency=concurrency, on_failure=mark_comic_failed)
+    refresher = asyncio.create_task(prompts.run_cache_refresher())
+
+    # Stop claiming on SIGTERM/SIGINT and let running jobs finish
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.stop)
+
+    try:
+        await worker.run()
+    finally:
+        refresher.cancel()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run comic generation workers")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("WORKER_CONCURRENCY", "4")),
+                        help="Number of jobs this process runs at the same time")
+    args = parser.parse_args()
+    asyncio.run(main(args.concurrency))